@@ -1,16 +1,53 @@
+import importlib
 import numpy as np
-from sympy import *
-from numba import njit
 import asd
-u = Symbol('|z|', real=True)
-p = Symbol('p', real=True)
-s = Symbol('s', real=True)
-B = Symbol('beta', real=True)
-C = Symbol('A_2', real=True)
-D = Symbol('A_1', real=True)
-n = Symbol('n_z', real=True)
-o = Symbol('g', real=True)
-m = Symbol('\mu_B', real=True)
+
+# Symbolic derivation of the effective fields, moved to symbolic.py so that sympy is only imported
+# when a field has to be derived. They remain available here through __getattr__.
+SYMBOLIC_FUNCTIONS = ('l_function', 'integrand_exponent', 'eff_hamiltonian', 'eff_hamiltonian_classical',
+                      'eff_field_formal', 'field_function_source', 'generate_field_function',
+                      'eff_hamiltonian_exact', 'eff_hamiltonian_classical_exact', 'eff_field_formal_exact',
+                      'generate_field_function_exact')
+
+
+def quantum_state_probabilities(quantum_spin, temperature, a_0, a_1, a_2):
+    """Returns (m, p, F) where p[..., k] is the thermal probability of the state |s,m[k]> for the
+    Hamiltonian H = -(A_0 + A_1 * S_z + A_2 * S_z^2) and F = -kB T ln(Z) the free energy, with
+
+    Z = Sum_[m=-s..s] exp(beta * (A_0 + A_1 * m + A_2 * m^2))
+
+    The temperature and the A's are broadcast against each other, so a whole grid of parameters is
+    evaluated at once. The sums are taken relative to the largest exponent (log-sum-exp) so that
+    they cannot overflow at low temperature or large spin.
+    """
+    temperature, a_0, a_1, a_2 = np.broadcast_arrays(*(np.asarray(x, dtype=float)
+                                                       for x in (temperature, a_0, a_1, a_2)))
+    q_m = np.arange(-quantum_spin, quantum_spin + 1)
+    exponent = (a_0[..., np.newaxis] + a_1[..., np.newaxis] * q_m + a_2[..., np.newaxis] * q_m**2) \
+        / (asd.kB * temperature[..., np.newaxis])
+
+    largest_exponent = np.max(exponent, axis=-1, keepdims=True)
+    weights = np.exp(exponent - largest_exponent)
+    partition_function = np.sum(weights, axis=-1, keepdims=True)
+    free_energy = -asd.kB * temperature * (largest_exponent[..., 0] + np.log(partition_function[..., 0]))
+
+    return q_m, weights / partition_function, free_energy
+
+
+def quantum_state_moments(quantum_spin, temperature, a_0, a_1, a_2):
+    """Returns the exact thermal averages for the Hamiltonian H = -(A_0 + A_1 * S_z + A_2 * S_z^2) as the tuple
+
+    (<S_z>/s, <(S_z)^2>, <(S_z)^2> - <S_z>^2, F = -kB T ln(Z))
+
+    from the probabilities of quantum_state_probabilities.
+    """
+    q_m, probabilities, free_energy = quantum_state_probabilities(quantum_spin, temperature, a_0, a_1, a_2)
+
+    sz = np.sum(probabilities * q_m, axis=-1)
+    sz_second_order_moment = np.sum(probabilities * q_m**2, axis=-1)
+    sz_variance = np.sum(probabilities * (q_m - sz[..., np.newaxis])**2, axis=-1)
+
+    return sz / quantum_spin, sz_second_order_moment, sz_variance, free_energy
 
 
 def quantum_state_sz(quantum_spin, temperature, a_0, a_1, a_2):
@@ -19,15 +56,7 @@ def quantum_state_sz(quantum_spin, temperature, a_0, a_1, a_2):
     <S_z>=(1/s)*(Sum_[m=-s..s] <s,m|m*exp(beta * (A_0 + A_1 * m + A_2 * m^2))|s,m>)
                                             /(Sum_[m=-s..s] <s,m|exp(beta * (A_0 + A_1 * m + A_2 * m^2))|s,m>)
     """
-    denominator = np.zeros(np.array(temperature).shape)
-    for q_m in np.arange(-quantum_spin, quantum_spin + 1):
-        denominator = denominator + np.exp((a_0 + a_1 * q_m + a_2 * q_m**2) / (asd.kB * temperature))
-
-    num = np.zeros(np.array(temperature).shape)
-    for q_m in np.arange(-quantum_spin, quantum_spin + 1):
-        num = num + q_m * np.exp((a_0 + a_1 * q_m + a_2 * q_m**2) / (asd.kB * temperature))
-
-    return (1.0/quantum_spin) * num / denominator
+    return quantum_state_moments(quantum_spin, temperature, a_0, a_1, a_2)[0]
 
 
 def quantum_state_sz_square(quantum_spin, temperature, a_0, a_1, a_2):
@@ -36,15 +65,8 @@ def quantum_state_sz_square(quantum_spin, temperature, a_0, a_1, a_2):
     <S_z>^2=[(Sum_[m=-s..s] <s,m|m*exp(beta * (A_0 + A_1 * m + A_2 * m^2))|s,m>)
                                             /(Sum_[m=-s..s] <s,m|exp(beta * (A_0 + A_1 * m + A_2 * m^2))|s,m>)]^2
     """
-    denominator = np.zeros(np.array(temperature).shape)
-    for q_m in np.arange(-quantum_spin, quantum_spin + 1):
-        denominator = denominator + np.exp((a_0 + a_1 * q_m + a_2 * q_m**2) / (asd.kB * temperature))
-
-    num = np.zeros(np.array(temperature).shape)
-    for q_m in np.arange(-quantum_spin, quantum_spin + 1):
-        num = num + q_m * np.exp((a_0 + a_1 * q_m + a_2 * q_m**2) / (asd.kB * temperature))
-
-    return num*num / (denominator*denominator)
+    sz = quantum_spin * quantum_state_moments(quantum_spin, temperature, a_0, a_1, a_2)[0]
+    return sz * sz
 
 
 def quantum_state_sz_second_order_moment(quantum_spin, temperature, a_0, a_1, a_2):
@@ -53,109 +75,34 @@ def quantum_state_sz_second_order_moment(quantum_spin, temperature, a_0, a_1, a_
     <(S_z)^2>=(Sum_[m=-s..s] <s,m|m**2 * exp(beta * (A_0 + A_1 * m + A_2 * m^2))|s,m>)
                                             /(Sum_[m=-s..s] <s,m|exp(beta * (A_0 + A_1 * m + A_2 * m^2))|s,m>)
     """
-    denominator = np.zeros(np.array(temperature).shape)
-    for q_m in np.arange(-quantum_spin, quantum_spin + 1):
-        denominator = denominator + np.exp((a_0 + a_1 * q_m + a_2 * q_m**2) / (asd.kB * temperature))
-
-    num = np.zeros(np.array(temperature).shape)
-    for q_m in np.arange(-quantum_spin, quantum_spin + 1):
-        num = num + q_m**2 * np.exp((a_0 + a_1 * q_m + a_2 * q_m**2) / (asd.kB * temperature))
-
-    return num / denominator
-
-
-def l_function(two_s):
-    """Returns a sympy function resulting from expression (12) of the z-dependent part of the integrand
-        of the partition function.
-        """
-    return simplify(expand(summation(binomial(two_s, p) * u**(2*p) * exp(B * C * p**2)
-                                     * exp(-B * (two_s*C + D)*p), (p, 0, two_s))))
-
+    return quantum_state_moments(quantum_spin, temperature, a_0, a_1, a_2)[1]
 
-def integrand_exponent(two_s):
-    """Returns the exponent of the integrand of the partition function written as an exponential using
-        the ln function.
-        """
-    return simplify(expand(-ln(l_function(two_s))+(two_s*ln(1+u**2))))
 
+def quantum_state_susceptibility(quantum_spin, temperature, a_0, a_1, a_2):
+    """Returns the susceptibility of the normalised expectation value of z component of spin to the
+    field B (per Tesla, A_1 = g mu_B B) from its fluctuations
 
-def eff_hamiltonian(two_s, order):
-    """Returns a sympy polynomial approximation in powers of beta of the exponential
-        approximation of the integrand of the partition function
-        """
-    return simplify(series(integrand_exponent(two_s), B, 0, order, dir='+').removeO()/B)
-
-
-def eff_hamiltonian_classical(two_s, order):
-    """Returns a converted version of the effective Hamiltonian in terms of the z-component of the
-        spin coherent state vector n.
-        """
-    return simplify(eff_hamiltonian(two_s, order).subs(u**2, (1-n)/(1+n)))
-
-
-def eff_field_formal(two_s, order):
-    """Returns the effective field corresponding to the effective Hamiltonian.
-        """
-    return simplify((-2/(two_s*o*m)) * diff(eff_hamiltonian_classical(two_s, order), n))
-
-
-def generate_field_function(quantum_spin, order):
-    """Casts the sympy expression from the method eff_field_formal into a njit python function
-    with variables B = beta,  C = A_2,  D = A_1,  n = n_z,  o = g,  m = mu_B.
-
-    Usable as:
-
-    effective_field = generate_field_function(quantum_spin, order)
-    effective_field(beta, A_2, A_1, n_z, g, mu_B)
-
+    d(<S_z>/s)/dB = g mu_B beta (<(S_z)^2> - <S_z>^2) / s
     """
-    g = lambdify([B, C, D, n, o, m], eff_field_formal(int(quantum_spin*2), order), 'numpy')
-    return njit(g)
-
-# Exact test
-
-def eff_hamiltonian_exact(two_s):
-    """Returns a sympy polynomial approximation in powers of beta of the exponential
-        approximation of the integrand of the partition function
-        """
-    return integrand_exponent(two_s)/B
-
+    sz_variance = quantum_state_moments(quantum_spin, temperature, a_0, a_1, a_2)[2]
+    return asd.g_factor * asd.muB * sz_variance / (asd.kB * np.asarray(temperature) * quantum_spin)
 
-def eff_hamiltonian_classical_exact(two_s):
-    """Returns a converted version of the effective Hamiltonian in terms of the z-component of the
-        spin coherent state vector n.
-        """
-    return simplify(eff_hamiltonian_exact(two_s).subs(u**2, (1-n)/(1+n)))
 
+def quantum_state_heat_capacity(quantum_spin, temperature, a_0, a_1, a_2):
+    """Returns the heat capacity in units of kB from the fluctuations of the energy
 
-def eff_field_formal_exact(two_s):
-    """Returns the effective field corresponding to the effective Hamiltonian.
-        """
-    return simplify((-2/(two_s*o*m)) * diff(eff_hamiltonian_classical_exact(two_s), n))
-
-
-def generate_field_function_exact(quantum_spin):
-    """Casts the sympy expression from the method eff_field_formal into a njit python function
-    with variables B = beta,  C = A_2,  D = A_1,  n = n_z,  o = g,  m = mu_B.
-
-    Usable as:
-
-    effective_field = generate_field_function_exact(quantum_spin)
-    effective_field(beta, A_2, A_1, n_z, g, mu_B)
-
+    C/kB = beta^2 (<H^2> - <H>^2),  H = -(A_0 + A_1 * S_z + A_2 * S_z^2)
     """
-    g = lambdify([B, C, D, n, o, m], eff_field_formal_exact(int(quantum_spin*2)), 'numpy')
-    return njit(g)
-
-
-
-
-def main():
-    print_latex(eff_field_formal(1, 2))
-    print_latex(eff_field_formal(2, 2))
-    print_latex(eff_field_formal(3, 2))
-    print_latex(eff_field_formal(4, 2))
-
-
-if __name__ == "__main__":
-    main()
+    q_m, probabilities, _ = quantum_state_probabilities(quantum_spin, temperature, a_0, a_1, a_2)
+    energies = -(np.asarray(a_0, dtype=float)[..., np.newaxis] + np.asarray(a_1, dtype=float)[..., np.newaxis] * q_m
+                 + np.asarray(a_2, dtype=float)[..., np.newaxis] * q_m**2)
+    energy = np.sum(probabilities * energies, axis=-1)
+    energy_variance = np.sum(probabilities * (energies - energy[..., np.newaxis])**2, axis=-1)
+    return energy_variance / (asd.kB * np.asarray(temperature))**2
+
+
+def __getattr__(name):
+    """Returns the functions of symbolic.py listed in SYMBOLIC_FUNCTIONS, importing sympy on first use"""
+    if name in SYMBOLIC_FUNCTIONS:
+        return getattr(importlib.import_module('symbolic'), name)
+    raise AttributeError(f"module 'analytic' has no attribute '{name}'")
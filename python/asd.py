@@ -1,7 +1,13 @@
+import functools
+import hashlib
+import importlib.util
+import os
+import sys
 import numpy as np
-from numba import njit
+from numba import njit, prange
 from scipy import constants as scp
-import analytic
+import fields
+import rng
 
 muB = scp.value("Bohr magneton")  # J T^-1
 g_factor = np.fabs(scp.value("electron g factor"))  # dimensionless
@@ -19,7 +25,16 @@ def rescale_spin(spin):
 
 
 @njit
-def random_field(time_step, temperature, alpha, quantum_spin):
+def noise_amplitude(time_step, temperature, alpha, quantum_spin):
+    """Returns the standard deviation of each component of the stochastic thermal field
+    (see random_field)
+    """
+    return np.sqrt((2 * kB * alpha * temperature)
+                   / (time_step * g_factor * muB * quantum_spin * gyro))
+
+
+@njit
+def random_field(time_step, temperature, alpha, quantum_spin, normals):
     """Returns the stochastic thermal field which obeys the statistical properties
 
     〈ηᵢ(t)〉= 0
@@ -29,18 +44,19 @@ def random_field(time_step, temperature, alpha, quantum_spin):
 
     Note the time step appears on the bottom below because we multiply by the time step
     in the numerical integration, so the overall effect is √(Δt) for the Wiener process.
+
+    normals are three standard normal numbers, normally taken from a stream of rng.py.
     """
-    gamma = np.sqrt((2 * kB * alpha * temperature)
-                    / (time_step * g_factor * muB * quantum_spin * gyro))
-    return np.random.normal(0, gamma, 3)
+    gamma = noise_amplitude(time_step, temperature, alpha, quantum_spin)
+    return gamma * normals
 
 
 @njit
-def spin_advance_symplectic(spin, field, time_step, temperature, alpha, quantum_spin):
+def spin_advance_symplectic(spin, field, time_step, temperature, alpha, quantum_spin, normals):
     """Given an initial spin s(t), returns s(t+dt) by symplectic integration
      of the damped precession around the effective field
      """
-    effective_field = field(spin, temperature) + random_field(time_step, temperature, alpha, quantum_spin)
+    effective_field = field(spin, temperature) + random_field(time_step, temperature, alpha, quantum_spin, normals)
 
     effective_precession = (gyro / (1 + alpha ** 2)) * (effective_field + alpha * np.cross(spin, effective_field))
 
@@ -71,11 +87,11 @@ def rhs_runge_kutta_4(spin, field, noise, alpha):
 
 
 @njit
-def spin_advance_runge_kutta_4(spin, field, time_step, temperature, alpha, quantum_spin):
+def spin_advance_runge_kutta_4(spin, field, time_step, temperature, alpha, quantum_spin, normals):
     """Given an initial spin s(t), returns s(t+dt) by RK4 integration
      of the damped precession around the effective field
      """
-    noise = random_field(time_step, temperature, alpha, quantum_spin)
+    noise = random_field(time_step, temperature, alpha, quantum_spin, normals)
 
     rk_step_1 = rhs_runge_kutta_4(spin, field(spin, temperature), noise, alpha)
     spin_step_1 = rescale_spin(spin + (time_step / 2) * rk_step_1)
@@ -93,41 +109,580 @@ def spin_advance_runge_kutta_4(spin, field, time_step, temperature, alpha, quant
     return rescale_spin(new_spin)
 
 
+@njit
+def normalised(x, y, z):
+    """Returns the components of the vector (x, y, z) renormalised to a unit vector"""
+    norm = np.sqrt(x * x + y * y + z * z)
+    return x / norm, y / norm, z / norm
+
+
+@njit
+def precession_vector(sx, sy, sz, hx, hy, hz, alpha):
+    """Returns the components of the vector w about which the Landau-Lifshitz-Gilbert equation
+    rotates the spin (sx, sy, sz), ds/dt = w x s, where (hx, hy, hz) is the total field
+    """
+    prefactor = gyro / (1 + alpha ** 2)
+
+    # effective_precession = prefactor * (h + alpha * s x h)
+    return (prefactor * (hx + alpha * (sy * hz - sz * hy)),
+            prefactor * (hy + alpha * (sz * hx - sx * hz)),
+            prefactor * (hz + alpha * (sx * hy - sy * hx)))
+
+
+@njit
+def rotation(sx, sy, sz, wx, wy, wz, time_step):
+    """Returns the components of the spin (sx, sy, sz) rotated about the vector (wx, wy, wz) by
+    the angle |w| time_step, i.e. the exact solution of ds/dt = w x s for a constant w
+    """
+    # torque = w x s
+    tx = wy * sz - wz * sy
+    ty = wz * sx - wx * sz
+    tz = wx * sy - wy * sx
+    energy = wx * sx + wy * sy + wz * sz
+
+    precession_norm = np.sqrt(wx * wx + wy * wy + wz * wz)
+
+    energy_over_norm = energy / precession_norm
+    cos_precession = np.cos(precession_norm * time_step)
+    sin_precession = np.sin(precession_norm * time_step)
+    parallel = energy_over_norm * (1.0 - cos_precession)
+
+    return (cos_precession * sx + (sin_precession * tx + parallel * wx) / precession_norm,
+            cos_precession * sy + (sin_precession * ty + parallel * wy) / precession_norm,
+            cos_precession * sz + (sin_precession * tz + parallel * wz) / precession_norm)
+
+
+@njit
+def symplectic_rotation(sx, sy, sz, hx, hy, hz, time_step, alpha):
+    """Returns the components of s(t+dt) for the symplectic step of spin_advance_symplectic
+    written with scalars only, where (hx, hy, hz) is the total (effective + stochastic) field
+    """
+    wx, wy, wz = precession_vector(sx, sy, sz, hx, hy, hz, alpha)
+    return rotation(sx, sy, sz, wx, wy, wz, time_step)
+
+
+@njit
+def llg_rhs(sx, sy, sz, hx, hy, hz, alpha):
+    """Returns the components of the RHS of the Landau-Lifshitz-Gilbert equation (see
+    rhs_runge_kutta_4) written with scalars only, where (hx, hy, hz) is the total field
+    """
+    prefactor = -gyro / (1 + alpha ** 2)
+
+    # torque = s x h
+    tx = sy * hz - sz * hy
+    ty = sz * hx - sx * hz
+    tz = sx * hy - sy * hx
+
+    # damping = s x torque
+    dx = sy * tz - sz * ty
+    dy = sz * tx - sx * tz
+    dz = sx * ty - sy * tx
+
+    return (prefactor * (tx + alpha * dx),
+            prefactor * (ty + alpha * dy),
+            prefactor * (tz + alpha * dz))
+
+
+@njit(inline='always')
+def symplectic_step(sx, sy, sz, field, beta, gamma, normal_x, normal_y, normal_z, a_1, a_2, time_step, alpha):
+    """Returns the components of s(t+dt) for one symplectic step of the spin (sx, sy, sz), where
+    field is a z-field function from field_factory and gamma the noise amplitude"""
+    hx = gamma * normal_x
+    hy = gamma * normal_y
+    hz = field(beta, a_2, a_1, sz, g_factor, muB) + gamma * normal_z
+
+    return symplectic_rotation(sx, sy, sz, hx, hy, hz, time_step, alpha)
+
+
+@njit(inline='always')
+def runge_kutta_4_step(sx, sy, sz, field, beta, gamma, normal_x, normal_y, normal_z, a_1, a_2, time_step, alpha):
+    """Returns the components of s(t+dt) for one RK4 step of the spin (sx, sy, sz), where
+    field is a z-field function from field_factory and gamma the noise amplitude"""
+    # the same noise is used for all four stages
+    nx = gamma * normal_x
+    ny = gamma * normal_y
+    nz = gamma * normal_z
+
+    k1x, k1y, k1z = llg_rhs(sx, sy, sz, nx, ny, field(beta, a_2, a_1, sz, g_factor, muB) + nz, alpha)
+    s1x, s1y, s1z = normalised(sx + (time_step / 2) * k1x, sy + (time_step / 2) * k1y,
+                               sz + (time_step / 2) * k1z)
+
+    k2x, k2y, k2z = llg_rhs(s1x, s1y, s1z, nx, ny, field(beta, a_2, a_1, s1z, g_factor, muB) + nz, alpha)
+    s2x, s2y, s2z = normalised(sx + (time_step / 2) * k2x, sy + (time_step / 2) * k2y,
+                               sz + (time_step / 2) * k2z)
+
+    k3x, k3y, k3z = llg_rhs(s2x, s2y, s2z, nx, ny, field(beta, a_2, a_1, s2z, g_factor, muB) + nz, alpha)
+    s3x, s3y, s3z = normalised(sx + time_step * k3x, sy + time_step * k3y, sz + time_step * k3z)
+
+    k4x, k4y, k4z = llg_rhs(s3x, s3y, s3z, nx, ny, field(beta, a_2, a_1, s3z, g_factor, muB) + nz, alpha)
+
+    return normalised(sx + time_step * (k1x + 2 * k2x + 2 * k3x + k4x) / 6,
+                      sy + time_step * (k1y + 2 * k2y + 2 * k3y + k4y) / 6,
+                      sz + time_step * (k1z + 2 * k2z + 2 * k3z + k4z) / 6)
+
+
+@njit(inline='always')
+def heun_step(sx, sy, sz, field, beta, gamma, normal_x, normal_y, normal_z, a_1, a_2, time_step, alpha):
+    """Returns (sx, sy, sz, error) for one stochastic Heun step of the spin (sx, sy, sz), which
+    converges to the Stratonovich solution, where field is a z-field function from field_factory
+    and gamma the noise amplitude. Both stages see the same noise and are projected back onto the
+    sphere, and error is the distance between the Euler predictor and the Heun corrector.
+    """
+    nx = gamma * normal_x
+    ny = gamma * normal_y
+    nz = gamma * normal_z
+
+    k1x, k1y, k1z = llg_rhs(sx, sy, sz, nx, ny, field(beta, a_2, a_1, sz, g_factor, muB) + nz, alpha)
+    px, py, pz = normalised(sx + time_step * k1x, sy + time_step * k1y, sz + time_step * k1z)
+
+    k2x, k2y, k2z = llg_rhs(px, py, pz, nx, ny, field(beta, a_2, a_1, pz, g_factor, muB) + nz, alpha)
+    cx, cy, cz = normalised(sx + 0.5 * time_step * (k1x + k2x), sy + 0.5 * time_step * (k1y + k2y),
+                            sz + 0.5 * time_step * (k1z + k2z))
+
+    return cx, cy, cz, np.sqrt((cx - px) ** 2 + (cy - py) ** 2 + (cz - pz) ** 2)
+
+
+@njit(inline='always')
+def geometric_heun_step(sx, sy, sz, field, beta, gamma, normal_x, normal_y, normal_z, a_1, a_2, time_step,
+                        alpha):
+    """Returns (sx, sy, sz, error) for one step of the geometric Heun integrator: the spin is
+    rotated about the mean of the precession vectors at the start of the step and at the end of
+    a symplectic (rotation) predictor, so it stays exactly on the sphere. error is the distance
+    between the first order predictor and the second order result.
+    """
+    nx = gamma * normal_x
+    ny = gamma * normal_y
+    nz = gamma * normal_z
+
+    w1x, w1y, w1z = precession_vector(sx, sy, sz, nx, ny, field(beta, a_2, a_1, sz, g_factor, muB) + nz, alpha)
+    px, py, pz = rotation(sx, sy, sz, w1x, w1y, w1z, time_step)
+
+    w2x, w2y, w2z = precession_vector(px, py, pz, nx, ny, field(beta, a_2, a_1, pz, g_factor, muB) + nz, alpha)
+    cx, cy, cz = rotation(sx, sy, sz, 0.5 * (w1x + w2x), 0.5 * (w1y + w2y), 0.5 * (w1z + w2z), time_step)
+
+    return cx, cy, cz, np.sqrt((cx - px) ** 2 + (cy - py) ** 2 + (cz - pz) ** 2)
+
+
+@njit(inline='always')
+def ensemble_advance_symplectic(spins, field, a_1, a_2, time_step, temperatures, alpha, quantum_spin,
+                                normals):
+    """Advances in place every row of the (N, 3) array of spins by one step of the symplectic
+    integrator, spin i being at temperatures[i].
+
+    field is a z-field function from field_factory, usable as field(beta, A_2, A_1, n_z, g, mu_B),
+    and normals is the (N, 3) array of standard normal noise for this step. Each row sees exactly
+    the same update as spin_advance_symplectic but nothing is allocated.
+    """
+    for i in range(spins.shape[0]):
+        beta = 1.0 / (kB * temperatures[i])
+        gamma = noise_amplitude(time_step, temperatures[i], alpha, quantum_spin)
+
+        spins[i, 0], spins[i, 1], spins[i, 2] = symplectic_step(
+            spins[i, 0], spins[i, 1], spins[i, 2], field, beta, gamma,
+            normals[i, 0], normals[i, 1], normals[i, 2], a_1, a_2, time_step, alpha)
+
+
+@njit(inline='always')
+def ensemble_advance_runge_kutta_4(spins, field, a_1, a_2, time_step, temperatures, alpha, quantum_spin,
+                                   normals):
+    """Advances in place every row of the (N, 3) array of spins by one step of RK4 integration,
+    spin i being at temperatures[i].
+
+    field is a z-field function from field_factory, usable as field(beta, A_2, A_1, n_z, g, mu_B),
+    and normals is the (N, 3) array of standard normal noise for this step. Each row sees exactly
+    the same update as spin_advance_runge_kutta_4 but nothing is allocated.
+    """
+    for i in range(spins.shape[0]):
+        beta = 1.0 / (kB * temperatures[i])
+        gamma = noise_amplitude(time_step, temperatures[i], alpha, quantum_spin)
+
+        spins[i, 0], spins[i, 1], spins[i, 2] = runge_kutta_4_step(
+            spins[i, 0], spins[i, 1], spins[i, 2], field, beta, gamma,
+            normals[i, 0], normals[i, 1], normals[i, 2], a_1, a_2, time_step, alpha)
+
+
+@njit(inline='always')
+def ensemble_advance_heun(spins, field, a_1, a_2, time_step, temperatures, alpha, quantum_spin, normals,
+                          geometric):
+    """Advances in place every row of the (N, 3) array of spins by one step of heun_step, or of
+    geometric_heun_step if geometric, spin i being at temperatures[i]"""
+    for i in range(spins.shape[0]):
+        beta = 1.0 / (kB * temperatures[i])
+        gamma = noise_amplitude(time_step, temperatures[i], alpha, quantum_spin)
+
+        if geometric:
+            spins[i, 0], spins[i, 1], spins[i, 2], _ = geometric_heun_step(
+                spins[i, 0], spins[i, 1], spins[i, 2], field, beta, gamma,
+                normals[i, 0], normals[i, 1], normals[i, 2], a_1, a_2, time_step, alpha)
+        else:
+            spins[i, 0], spins[i, 1], spins[i, 2], _ = heun_step(
+                spins[i, 0], spins[i, 1], spins[i, 2], field, beta, gamma,
+                normals[i, 0], normals[i, 1], normals[i, 2], a_1, a_2, time_step, alpha)
+
+
+# Integrators as integer ids, for the solvers of solver_module which take them at run time
+RUNGE_KUTTA_4 = 0
+SYMPLECTIC = 1
+HEUN = 2
+GEOMETRIC_HEUN = 3
+INTEGRATORS = {'runge-kutta-4': RUNGE_KUTTA_4, 'symplectic': SYMPLECTIC, 'heun': HEUN,
+               'geometric-heun': GEOMETRIC_HEUN}
+
+
+@njit(inline='always')
+def spin_advance(spin, field, temperature, normals, integrator, quantum_spin, a_1, a_2, alpha, time_step):
+    """Given an initial spin s(t), returns s(t+dt) with the integrator given by its id in INTEGRATORS.
+    All parameters are run time arguments, field being a z-field function from field_factory.
+    """
+    beta = 1.0 / (kB * temperature)
+    gamma = noise_amplitude(time_step, temperature, alpha, quantum_spin)
+
+    if integrator == RUNGE_KUTTA_4:
+        sx, sy, sz = runge_kutta_4_step(spin[0], spin[1], spin[2], field, beta, gamma,
+                                        normals[0], normals[1], normals[2], a_1, a_2, time_step, alpha)
+    elif integrator == HEUN:
+        sx, sy, sz, _ = heun_step(spin[0], spin[1], spin[2], field, beta, gamma,
+                                  normals[0], normals[1], normals[2], a_1, a_2, time_step, alpha)
+    elif integrator == GEOMETRIC_HEUN:
+        sx, sy, sz, _ = geometric_heun_step(spin[0], spin[1], spin[2], field, beta, gamma,
+                                            normals[0], normals[1], normals[2], a_1, a_2, time_step, alpha)
+    else:
+        sx, sy, sz = symplectic_step(spin[0], spin[1], spin[2], field, beta, gamma,
+                                     normals[0], normals[1], normals[2], a_1, a_2, time_step, alpha)
+
+    return np.array((sx, sy, sz))
+
+
+@njit(inline='always')
+def ensemble_advance(spins, field, temperatures, normals, integrator, quantum_spin, a_1, a_2, alpha, time_step):
+    """Advances in place every row of the (N, 3) array of spins with the integrator given by its id
+    in INTEGRATORS. All parameters are run time arguments, field being a z-field function from
+    field_factory.
+    """
+    if integrator == RUNGE_KUTTA_4:
+        ensemble_advance_runge_kutta_4(spins, field, a_1, a_2, time_step, temperatures, alpha,
+                                       quantum_spin, normals)
+    elif integrator == HEUN or integrator == GEOMETRIC_HEUN:
+        ensemble_advance_heun(spins, field, a_1, a_2, time_step, temperatures, alpha, quantum_spin,
+                              normals, integrator == GEOMETRIC_HEUN)
+    else:
+        ensemble_advance_symplectic(spins, field, a_1, a_2, time_step, temperatures, alpha,
+                                    quantum_spin, normals)
+
+
+# Persistent solver cache
+#
+# Numba cannot cache a function which holds another jitted function as a constant unless the call
+# taking it is inlined, which is why every function taking a field or solver is inline='always'.
+CACHE_DIR = os.environ.get('PISD_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pisd'))
+
+SOLVER_MODULE_TEMPLATE = '''"""Solvers for the {approximation} effective field with 2s = {two_s} and order {order}.
+
+Generated by asd.solver_module from the field expression of fields.py or symbolic.py, do not edit.
+The field is a global of this module rather than a closure so that numba can cache every function
+on disk.
+"""
+import numpy
+from numba import njit
+
+import asd
+
+
+@njit(cache=True)
+def field(beta, A_2, A_1, n_z, g, mu_B):
+    return {expression}
+
+
+@njit(cache=True)
+def solver(spin, temperature, normals, integrator, quantum_spin, a_1, a_2, alpha, time_step):
+    return asd.spin_advance(spin, field, temperature, normals, integrator, quantum_spin, a_1, a_2, alpha,
+                            time_step)
+
+
+@njit(cache=True)
+def ensemble_solver(spins, temperatures, normals, integrator, quantum_spin, a_1, a_2, alpha, time_step):
+    asd.ensemble_advance(spins, field, temperatures, normals, integrator, quantum_spin, a_1, a_2, alpha,
+                         time_step)
+
+
+@njit(cache=True)
+def compute_temperature_dependence(temperatures, low_high_t, quantum_spin, time_step, equilibration_time,
+                                   production_time, num_realisation, spin_initial, seed, solver_args):
+    return asd.compute_temperature_dependence(solver, temperatures, low_high_t, quantum_spin, time_step,
+                                              equilibration_time, production_time, num_realisation,
+                                              spin_initial, seed, solver_args)
+
+
+@njit(parallel=True, cache=True)
+def compute_temperature_dependence_parallel(temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, seed, solver_args):
+    return asd.compute_temperature_dependence_parallel(solver, temperatures, low_high_t, quantum_spin,
+                                                       time_step, equilibration_time, production_time,
+                                                       num_realisation, spin_initial, seed, solver_args)
+
+
+@njit(cache=True)
+def advance_ensemble(spins, temperatures, first_step, last_step, num_eq_steps, seed, temperature_indices,
+                     realisations, spin_z, solver_args):
+    asd.advance_ensemble(ensemble_solver, spins, temperatures, first_step, last_step, num_eq_steps, seed,
+                         temperature_indices, realisations, spin_z, solver_args)
+
+
+@njit(cache=True)
+def advance_ensemble_counted(spins, temperatures, first_step, last_step, num_eq_steps, seed, temperature_indices,
+                             realisations, spin_z, counters, solver_args):
+    asd.advance_ensemble_counted(ensemble_solver, field, spins, temperatures, first_step, last_step, num_eq_steps,
+                                 seed, temperature_indices, realisations, spin_z, counters, solver_args)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_adaptive(temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, tolerance, detect_equilibration, seed, solver_args):
+    return asd.compute_temperature_dependence_adaptive(solver, temperatures, low_high_t, quantum_spin,
+                                                       time_step, equilibration_time, production_time,
+                                                       num_realisation, spin_initial, tolerance,
+                                                       detect_equilibration, seed, solver_args)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_detected(temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, seed, solver_args):
+    return asd.compute_temperature_dependence_detected(solver, temperatures, low_high_t, quantum_spin,
+                                                       time_step, equilibration_time, production_time,
+                                                       num_realisation, spin_initial, seed, solver_args)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_annealed(temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, reequilibration_time, production_time,
+                                            num_realisation, spin_initial, seed, solver_args):
+    return asd.compute_temperature_dependence_annealed(solver, temperatures, low_high_t, quantum_spin,
+                                                       time_step, equilibration_time, reequilibration_time,
+                                                       production_time, num_realisation, spin_initial, seed,
+                                                       solver_args)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_exchange(temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, exchange_time, seed, solver_args):
+    return asd.compute_temperature_dependence_exchange(ensemble_solver, field, temperatures, low_high_t,
+                                                       quantum_spin, time_step, equilibration_time,
+                                                       production_time, num_realisation, spin_initial,
+                                                       exchange_time, seed, solver_args)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_observables(temperatures, low_high_t, quantum_spin, time_step,
+                                               equilibration_time, production_time, num_realisation,
+                                               spin_initial, seed, solver_args):
+    return asd.compute_temperature_dependence_observables(solver, field, temperatures, low_high_t, quantum_spin,
+                                                          time_step, equilibration_time, production_time,
+                                                          num_realisation, spin_initial, seed, solver_args)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_histogram(temperatures, low_high_t, quantum_spin, time_step,
+                                             equilibration_time, production_time, num_realisation,
+                                             spin_initial, seed, solver_args):
+    return asd.compute_temperature_dependence_histogram(solver, temperatures, low_high_t, quantum_spin,
+                                                        time_step, equilibration_time, production_time,
+                                                        num_realisation, spin_initial, seed, solver_args)
+
+
+@njit(cache=True)
+def effective_energy_table(beta, quantum_spin, a_1, a_2):
+    return asd.effective_energy_table(field, beta, quantum_spin, a_1, a_2)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_adaptive_step(temperatures, low_high_t, quantum_spin, equilibration_time,
+                                                 production_time, num_realisation, spin_initial, step_tolerance,
+                                                 seed, solver_args):
+    return asd.compute_temperature_dependence_adaptive_step(field, temperatures, low_high_t, quantum_spin,
+                                                            equilibration_time, production_time, num_realisation,
+                                                            spin_initial, step_tolerance, seed, solver_args)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_quadrature(temperatures, low_high_t, quantum_spin, a_1, a_2):
+    return asd.compute_temperature_dependence_quadrature(field, temperatures, low_high_t, quantum_spin, a_1, a_2)
+
+
+@njit(cache=True)
+def compute_temperature_dependence_ensemble(temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, seed, solver_args):
+    return asd.compute_temperature_dependence_ensemble(ensemble_solver, temperatures, low_high_t, quantum_spin,
+                                                       time_step, equilibration_time, production_time,
+                                                       num_realisation, spin_initial, seed, solver_args)
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Returns a short hash of the source of the modules the compiled solvers are built from"""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module_name in ('symbolic', 'fields', 'rng', 'asd'):
+        file_name = os.path.join(directory, f'{module_name}.py')
+        with open(file_name, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+def solver_module(approximation, order, quantum_spin):
+    """Returns the module of compiled solvers for the effective field of the approximation. Its
+    source is generated in CACHE_DIR the first time, taking the field from the library fields.py
+    so that sympy is only needed for a (2s, order) missing from it.
+
+    Only the field expression is fixed in the module: the integrator and the physical parameters
+    are run time arguments (see solver_arguments), so one set of compiled functions, cached on
+    disk by numba, serves every parameter set in this and every later process. The module defines
+
+    field(beta, A_2, A_1, n_z, g, mu_B)
+    solver(spin, temperature, normals, *solver_args)
+    ensemble_solver(spins, temperatures, normals, *solver_args)
+
+    and advance_ensemble, advance_ensemble_counted, compute_temperature_dependence,
+    compute_temperature_dependence_parallel, compute_temperature_dependence_ensemble,
+    compute_temperature_dependence_detected,
+    compute_temperature_dependence_adaptive, compute_temperature_dependence_annealed,
+    compute_temperature_dependence_exchange, compute_temperature_dependence_observables and
+    compute_temperature_dependence_histogram, which take the arguments of the functions of the same
+    name in this module except the solver (and field), with seed and solver_args required, and
+    compute_temperature_dependence_adaptive_step, compute_temperature_dependence_quadrature and
+    effective_energy_table, which take those of their namesakes except the field.
+    """
+    if approximation == 'classical-limit':
+        order = 2
+    elif approximation == 'quantum-exact':
+        order = None
+    elif approximation != 'quantum-approximation':
+        raise RuntimeError(f'Unknown approximation: {approximation}')
+
+    return load_solver_module(approximation, int(quantum_spin * 2), order)
+
+
+@functools.lru_cache(maxsize=None)
+def load_solver_module(approximation, two_s, order):
+    """Returns the solver module of solver_module, writing its source first if it is not in the cache"""
+    order_label = 'exact' if order is None else f'order{order}'
+    name = f'solvers_{approximation.replace("-", "_")}_2s{two_s}_{order_label}_{code_version()}'
+    file_name = os.path.join(CACHE_DIR, f'{name}.py')
+
+    if not os.path.exists(file_name):
+        # derive the field with sympy only if it is not in the library built by build_fields.py
+        expression = fields.FIELD_SOURCES.get((two_s, order))
+        if expression is None:
+            import symbolic  # imports sympy, which is slow, so only when a field has to be derived
+            if order is None:
+                expression = symbolic.field_function_source(symbolic.eff_field_formal_exact(two_s))
+            else:
+                expression = symbolic.field_function_source(symbolic.eff_field_formal(two_s, order))
+
+        source = SOLVER_MODULE_TEMPLATE.format(approximation=approximation, two_s=two_s, order=order_label,
+                                               expression=expression)
+
+        # write then rename so that concurrent processes never import a partial file
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temporary_file_name = f'{file_name}.{os.getpid()}.tmp'
+        with open(temporary_file_name, 'w') as module_file:
+            module_file.write(source)
+        os.replace(temporary_file_name, file_name)
+
+    spec = importlib.util.spec_from_file_location(name, file_name)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def solver_arguments(method, quantum_spin, a_1, a_2, alpha, time_step):
+    """Returns the run time arguments of the solvers of solver_module, passed as solver_args to the
+    functions computing the temperature dependence"""
+    if method not in INTEGRATORS:
+        raise RuntimeError(f'Unknown integrator: {method}')
+    return INTEGRATORS[method], float(quantum_spin), float(a_1), float(a_2), float(alpha), float(time_step)
+
+
+def field_factory(approximation, order, quantum_spin):
+    """Returns the njit z-component of the effective field for the approximation, usable as
+
+    field(beta, A_2, A_1, n_z, g, mu_B)
+    """
+    return solver_module(approximation, order, quantum_spin).field
+
+
+@functools.lru_cache(maxsize=None)
 def solver_factory(method, approximation, order, quantum_spin, a_1, a_2, alpha, time_step):
     """Returns the atomistic solver corresponding to the method of integration and approximation
-    for the computation of the effective field
+    for the computation of the effective field, usable as
+
+    solver(spin, temperature, normals)
+
+    where normals are the three standard normal numbers of the noise for the step.
     """
-    if approximation == 'classical-limit':
-        field_from_hamiltonian = analytic.generate_field_function(quantum_spin, 2)
+    field_from_hamiltonian = field_factory(approximation, order, quantum_spin)
 
-        @njit
-        def field_function(spin, temperature):
-            return np.array(([0, 0, field_from_hamiltonian(1.0/(kB * temperature), a_2, a_1, spin[2], g_factor, muB)]))
-    elif approximation == "quantum-approximation":
-        field_from_hamiltonian = analytic.generate_field_function(quantum_spin, order)
+    @njit
+    def field_function(spin, temperature):
+        return np.array(([0, 0, field_from_hamiltonian(1.0/(kB * temperature), a_2, a_1, spin[2], g_factor, muB)]))
 
+    if method == 'runge-kutta-4':
         @njit
-        def field_function(spin, temperature):
-            return np.array(([0, 0, field_from_hamiltonian(1.0/(kB * temperature), a_2, a_1, spin[2], g_factor, muB)]))
-    elif approximation == "quantum-exact":
-        field_from_hamiltonian = analytic.generate_field_function_exact(quantum_spin)
+        def solver_function(spin, temperature, normals):
+            return spin_advance_runge_kutta_4(
+                spin, field_function, time_step, temperature, alpha, quantum_spin, normals)
+    elif method == 'symplectic':
+        @njit
+        def solver_function(spin, temperature, normals):
+            return spin_advance_symplectic(
+                spin, field_function, time_step, temperature, alpha, quantum_spin, normals)
+    elif method in INTEGRATORS:
+        integrator = INTEGRATORS[method]
 
         @njit
-        def field_function(spin, temperature):
-            return np.array(([0, 0, field_from_hamiltonian(1.0/(kB * temperature), a_2, a_1, spin[2], g_factor, muB)]))
+        def solver_function(spin, temperature, normals):
+            return spin_advance(spin, field_from_hamiltonian, temperature, normals, integrator, quantum_spin,
+                                a_1, a_2, alpha, time_step)
     else:
-        raise RuntimeError(f'Unknown approximation: {approximation}')
+        raise RuntimeError(f'Unknown integrator: {method}')
+
+    return solver_function
+
+
+@functools.lru_cache(maxsize=None)
+def ensemble_solver_factory(method, approximation, order, quantum_spin, a_1, a_2, alpha, time_step):
+    """Returns the ensemble counterpart of solver_factory: a solver which advances in place a
+    whole (N, 3) array of spins, row i at temperatures[i], usable as
+
+    solver(spins, temperatures, normals)
+
+    where normals is the (N, 3) array of standard normal noise for the step.
+    """
+    field_from_hamiltonian = field_factory(approximation, order, quantum_spin)
 
     if method == 'runge-kutta-4':
         @njit
-        def solver_function(spin, temperature):
-            return spin_advance_runge_kutta_4(
-                spin, field_function, time_step, temperature, alpha, quantum_spin)
+        def solver_function(spins, temperatures, normals):
+            ensemble_advance_runge_kutta_4(spins, field_from_hamiltonian, a_1, a_2, time_step,
+                                           temperatures, alpha, quantum_spin, normals)
     elif method == 'symplectic':
         @njit
-        def solver_function(spin, temperature):
-            return spin_advance_symplectic(
-                spin, field_function, time_step, temperature, alpha, quantum_spin)
+        def solver_function(spins, temperatures, normals):
+            ensemble_advance_symplectic(spins, field_from_hamiltonian, a_1, a_2, time_step,
+                                        temperatures, alpha, quantum_spin, normals)
+    elif method in INTEGRATORS:
+        integrator = INTEGRATORS[method]
+
+        @njit
+        def solver_function(spins, temperatures, normals):
+            ensemble_advance(spins, field_from_hamiltonian, temperatures, normals, integrator, quantum_spin,
+                             a_1, a_2, alpha, time_step)
     else:
         raise RuntimeError(f'Unknown integrator: {method}')
 
@@ -135,54 +690,1124 @@ def solver_factory(method, approximation, order, quantum_spin, a_1, a_2, alpha,
 
 
 # Result computation
-@njit
-def calculate_sz_asd(solver, spin_initial, temperature, num_eq_steps, num_production_steps,
-                     num_realisations):
-    """Returns the value of the expectation value of the z-component of the spin by averaging over
-    time and realisations of the noise
+@njit(inline='always')
+def calculate_sz_realisation(solver, spin_initial, temperature, num_eq_steps, num_production_steps,
+                             seed, temperature_index, realisation, solver_args=()):
+    """Returns the time average of the z-component of the spin for a single realisation of the noise,
+    the noise being taken from the stream (seed, temperature_index, realisation) of rng.py.
+
+    solver_args are extra run time arguments passed on to the solver, as needed by the solvers of
+    solver_module (see solver_arguments).
     """
-    sz_realisations = 0.0
-    for _ in range(num_realisations):
-        # Incase the initial spin is not properly normalised
-        spin = rescale_spin(spin_initial)
+    # Incase the initial spin is not properly normalised
+    spin = rescale_spin(spin_initial)
 
-        for _ in range(0, num_eq_steps):
-            spin = solver(spin, temperature)
+    normals = np.empty((rng.NOISE_BLOCK, 3))
+    spin_z = 0.0
+    for step in range(0, num_eq_steps + num_production_steps):
+        if step % rng.NOISE_BLOCK == 0:
+            rng.normal_block(seed, temperature_index, realisation, step, normals)
 
-        spin_z = 0.0
-        for _ in range(0, num_production_steps):
-            spin = solver(spin, temperature)
+        spin = solver(spin, temperature, normals[step % rng.NOISE_BLOCK], *solver_args)
+
+        if step >= num_eq_steps:
             spin_z += spin[2]
 
-        sz_realisations += spin_z / num_production_steps
+    return spin_z / num_production_steps
+
+
+@njit(inline='always')
+def calculate_sz_asd(solver, spin_initial, temperature, num_eq_steps, num_production_steps,
+                     num_realisations, seed, temperature_index, solver_args=()):
+    """Returns the value of the expectation value of the z-component of the spin by averaging over
+    time and realisations of the noise
+    """
+    sz_realisations = 0.0
+    for realisation in range(num_realisations):
+        sz_realisations += calculate_sz_realisation(solver, spin_initial, temperature, num_eq_steps,
+                                                    num_production_steps, seed, temperature_index,
+                                                    realisation, solver_args)
 
     return sz_realisations / num_realisations
 
 
 @njit
+def renormalisation_factor(low_high_t, quantum_spin):
+    """Returns the factor by which the expectation value of the z-component of the spin is
+    renormalised for the given approximation"""
+    if low_high_t in {'high-temperature-first-order', 'high-temperature-second-order', 'high-temperature-9th-order'}:
+        return (quantum_spin + 1.0) / quantum_spin
+    return 1.0
+
+
+@njit(inline='always')
 def compute_temperature_dependence(solver, temperatures, low_high_t, quantum_spin, time_step,
                                    equilibration_time, production_time, num_realisation,
-                                   spin_initial):
+                                   spin_initial, seed=None, solver_args=()):
     """Returns an array of expectation values of the z-component of the spin corresponding to the
-    input temperatures"""
+    input temperatures.
+
+    Realisation r at temperatures[i] uses the noise stream (seed, i, r) of rng.py so, for a given
+    seed, every engine below returns the same results to rounding. The parallel engine is identical
+    to this one, while the array arithmetic of the ensemble engine rounds differently, by about
+    1e-15. A fresh seed is drawn if none is given.
+    solver_args are passed on to the solver (see solver_module).
+    """
+    key = rng.random_seed() if seed is None else seed
+
     sz_expectation = np.zeros(np.shape(temperatures))
     i = 0
 
-    if low_high_t in {'high-temperature-first-order', 'high-temperature-second-order', 'high-temperature-9th-order'}:
-        renormalisation = (quantum_spin + 1.0) / quantum_spin
-    else:
-        renormalisation = 1
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
 
     for temperature in temperatures:
         sz_expectation[i] = renormalisation * calculate_sz_asd(solver, spin_initial, temperature,
                                                    int(equilibration_time / time_step)
                                                    , int(production_time / time_step),
-                                                   num_realisation)
+                                                   num_realisation, key, i, solver_args)
         i += 1
 
     return sz_expectation
 
 
+@njit(parallel=True, inline='always')
+def compute_temperature_dependence_parallel(solver, temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, seed=None, solver_args=()):
+    """Returns the same expectation values as compute_temperature_dependence with every
+    (temperature, realisation) pair run as an independent task spread over all threads.
+
+    Each task draws its noise from its own stream (seed, temperature_index, realisation), so for a
+    given seed the result does not depend on the number of threads or on the order in which tasks
+    are scheduled.
+    """
+    key = rng.random_seed() if seed is None else seed
+
+    num_temperatures = temperatures.shape[0]
+    num_eq_steps = int(equilibration_time / time_step)
+    num_production_steps = int(production_time / time_step)
+
+    spin_z = np.zeros(num_temperatures * num_realisation)
+    for task in prange(num_temperatures * num_realisation):
+        i = task // num_realisation
+        r = task % num_realisation
+        spin_z[task] = calculate_sz_realisation(solver, spin_initial, temperatures[i], num_eq_steps,
+                                                num_production_steps, key, i, r, solver_args)
+
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
+
+    sz_expectation = np.zeros(num_temperatures)
+    for i in range(num_temperatures):
+        for r in range(num_realisation):
+            sz_expectation[i] += spin_z[i * num_realisation + r]
+        sz_expectation[i] = renormalisation * sz_expectation[i] / num_realisation
+
+    return sz_expectation
+
+
+@njit(inline='always')
+def advance_ensemble(solver, spins, temperatures, first_step, last_step, num_eq_steps, seed,
+                     temperature_indices, realisations, spin_z, solver_args=()):
+    """Advances in place the (N, 3) ensemble of calculate_sz_ensemble from step first_step to
+    last_step (excluded), adding the z-component of each spin to spin_z at every production step,
+    i.e. from step num_eq_steps on. The noise depends only on the step, so a run can be split into
+    any number of such calls (see checkpoint.py) with identical results.
+    """
+    normals = np.empty(spins.shape)
+    for step in range(first_step, last_step):
+        rng.ensemble_normals(seed, temperature_indices, realisations, step, normals)
+        solver(spins, temperatures, normals, *solver_args)
+
+        if step >= num_eq_steps:
+            for i in range(spins.shape[0]):
+                spin_z[i] += spins[i, 2]
+
+
+@njit(inline='always')
+def advance_ensemble_counted(solver, field, spins, temperatures, first_step, last_step, num_eq_steps, seed,
+                             temperature_indices, realisations, spin_z, counters, solver_args):
+    """Advances the ensemble as advance_ensemble, with the same result, and adds to the counters once,
+    after the steps, so that the steps of the chunk run as fast as those of advance_ensemble:
+
+    counters[0]  the field evaluations at the end of the chunk, one at each finite spin, field being
+                 that of solver with the solver_args of solver_arguments
+    counters[1]  those of them which were not finite
+    counters[2]  the spins which were finite at the start of the chunk but not at its end, so that a
+                 spin which stays non-finite is counted once
+    """
+    _, _, a_1, a_2, _, _ = solver_args
+    was_finite = np.empty(spins.shape[0], dtype=np.bool_)
+    for i in range(spins.shape[0]):
+        was_finite[i] = np.isfinite(spins[i, 0]) and np.isfinite(spins[i, 1]) and np.isfinite(spins[i, 2])
+
+    advance_ensemble(solver, spins, temperatures, first_step, last_step, num_eq_steps, seed, temperature_indices,
+                     realisations, spin_z, solver_args)
+
+    for i in range(spins.shape[0]):
+        if np.isfinite(spins[i, 0]) and np.isfinite(spins[i, 1]) and np.isfinite(spins[i, 2]):
+            counters[0] += 1
+            if not np.isfinite(field(1.0 / (kB * temperatures[i]), a_2, a_1, spins[i, 2], g_factor, muB)):
+                counters[1] += 1
+        elif was_finite[i]:
+            counters[2] += 1
+
+
+@njit(inline='always')
+def calculate_sz_ensemble(solver, spins, temperatures, num_eq_steps, num_production_steps,
+                          seed, temperature_indices, realisations, solver_args=()):
+    """Returns the time average of the z-component of each spin of the (N, 3) ensemble, where
+    spins[i] evolves at temperatures[i] under the ensemble solver with the noise stream
+    (seed, temperature_indices[i], realisations[i]). spins is advanced in place.
+    """
+    spin_z = np.zeros(spins.shape[0])
+    advance_ensemble(solver, spins, temperatures, 0, num_eq_steps + num_production_steps, num_eq_steps, seed,
+                     temperature_indices, realisations, spin_z, solver_args)
+
+    return spin_z / num_production_steps
+
+
+@njit
+def initial_ensemble(temperatures, num_realisation, spin_initial):
+    """Returns (spins, temperatures, temperature_indices, realisations) of the ensemble in which
+    row i * num_realisation + r is realisation r at temperatures[i], every spin starting from
+    spin_initial"""
+    num_temperatures = temperatures.shape[0]
+
+    spins = np.empty((num_temperatures * num_realisation, 3))
+    ensemble_temperatures = np.empty(num_temperatures * num_realisation)
+    temperature_indices = np.empty(num_temperatures * num_realisation, dtype=np.int64)
+    realisations = np.empty(num_temperatures * num_realisation, dtype=np.int64)
+    sx, sy, sz = normalised(spin_initial[0], spin_initial[1], spin_initial[2])
+    for i in range(num_temperatures):
+        for r in range(num_realisation):
+            row = i * num_realisation + r
+            spins[row, 0], spins[row, 1], spins[row, 2] = sx, sy, sz
+            ensemble_temperatures[row] = temperatures[i]
+            temperature_indices[row] = i
+            realisations[row] = r
+
+    return spins, ensemble_temperatures, temperature_indices, realisations
+
+
+@njit
+def ensemble_average(spin_z, num_temperatures, num_realisation, renormalisation):
+    """Returns the expectation value at each temperature from the time averages spin_z of the rows
+    of an initial_ensemble"""
+    sz_expectation = np.zeros(num_temperatures)
+    for i in range(num_temperatures):
+        for r in range(num_realisation):
+            sz_expectation[i] += spin_z[i * num_realisation + r]
+        sz_expectation[i] = renormalisation * sz_expectation[i] / num_realisation
+
+    return sz_expectation
+
+
+@njit(inline='always')
+def compute_temperature_dependence_ensemble(solver, temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, seed=None, solver_args=()):
+    """Returns the same expectation values as compute_temperature_dependence, but every
+    (temperature, realisation) pair is held as one row of a single (N, 3) ensemble which is
+    advanced together by a solver from ensemble_solver_factory"""
+    key = rng.random_seed() if seed is None else seed
+
+    spins, ensemble_temperatures, temperature_indices, realisations = initial_ensemble(temperatures,
+                                                                                       num_realisation,
+                                                                                       spin_initial)
+
+    spin_z = calculate_sz_ensemble(solver, spins, ensemble_temperatures,
+                                   int(equilibration_time / time_step),
+                                   int(production_time / time_step),
+                                   key, temperature_indices, realisations, solver_args)
+
+    return ensemble_average(spin_z, temperatures.shape[0], num_realisation,
+                            renormalisation_factor(low_high_t, quantum_spin))
+
+
+# Equilibration detection and adaptive stopping
+BLOCK_TIME = 0.05  # ns, length of the blocks whose means give the blocking standard errors
+WINDOW_TIME = 0.01  # ns, length of the windows whose means equilibration detection is judged on
+MIN_EQUILIBRATION_WINDOWS = 64  # windows before has_equilibrated judges the later half of them
+EQUILIBRATION_SAMPLES = 8  # independent samples of S_z the judged half has to span
+CONSISTENCY_SIGMAS = 3.0  # standard deviations of chi-square by which the realisations may disagree
+EQUILIBRATION_BUDGET = 4.0  # longest detected equilibration, as a multiple of equilibration_time
+MIN_BLOCKS = 64  # blocks needed before the standard error is trusted to stop a run
+MIN_BLOCKING_SAMPLES = 16  # samples needed for a blocking level to be used
+
+
+@njit
+def blocking_standard_error(samples):
+    """Returns the standard error of the mean of correlated samples by the blocking method of
+    Flyvbjerg and Petersen, J. Chem. Phys. 91, 461 (1989): neighbouring samples are averaged in
+    pairs until they are uncorrelated, and the largest standard error over the levels with at
+    least MIN_BLOCKING_SAMPLES samples is returned.
+    """
+    blocks = samples.copy()
+    num_samples = blocks.shape[0]
+    if num_samples < 2:
+        return np.inf
+
+    standard_error = np.sqrt(np.var(blocks) / (num_samples - 1))
+    while num_samples // 2 >= MIN_BLOCKING_SAMPLES:
+        num_samples = num_samples // 2
+        for i in range(num_samples):
+            blocks[i] = 0.5 * (blocks[2 * i] + blocks[2 * i + 1])
+        standard_error = max(standard_error, np.sqrt(np.var(blocks[:num_samples]) / (num_samples - 1)))
+
+    return standard_error
+
+
+@njit
+def statistical_inefficiency(samples):
+    """Returns the number of consecutive correlated samples worth one independent sample, the square
+    of the ratio of their blocking_standard_error to that of uncorrelated samples, at least 1"""
+    num_samples = samples.shape[0]
+    variance = np.var(samples)
+    if num_samples < 2 or variance == 0.0:
+        return 1.0
+    return max(1.0, blocking_standard_error(samples) ** 2 * (num_samples - 1) / variance)
+
+
+@njit
+def has_equilibrated(window_means):
+    """Returns whether the realisations whose means over consecutive windows are the rows of
+    window_means have equilibrated. The earlier half of the windows is discarded as possibly still
+    drifting, and the later half has to
+
+    - span EQUILIBRATION_SAMPLES independent samples of every realisation, by its
+      statistical_inefficiency, so that the windows judged scale with the autocorrelation time
+    - no longer drift: the mean of its last quarter agrees with that of the quarter before within
+      two standard errors, over all the realisations
+    - give realisation means which agree with each other within their standard errors, by a
+      chi-square test, so that realisations left in different wells are not taken as equilibrated
+    """
+    num_realisations, num_windows = window_means.shape
+    if num_windows < MIN_EQUILIBRATION_WINDOWS:
+        return False
+
+    half = num_windows // 2
+    quarter = half // 2
+    means = np.empty(num_realisations)
+    mean_variances = np.empty(num_realisations)
+    drift = 0.0
+    drift_variance = 0.0
+    for r in range(num_realisations):
+        judged = window_means[r, num_windows - half:]
+        inefficiency = statistical_inefficiency(judged)
+        if half < EQUILIBRATION_SAMPLES * inefficiency:
+            return False
+
+        variance = inefficiency * np.var(judged)
+        means[r] = np.mean(judged)
+        # floored so that realisations frozen at the same S_z still agree
+        mean_variances[r] = variance / (half - 1) + 1e-12
+        drift += np.mean(judged[half - quarter:]) - np.mean(judged[half - 2 * quarter:half - quarter])
+        drift_variance += 2.0 * variance / quarter
+
+    if abs(drift) > 2.0 * np.sqrt(drift_variance):
+        return False
+
+    weights = 1.0 / mean_variances
+    weighted_mean = np.sum(weights * means) / np.sum(weights)
+    chi_square = np.sum(weights * (means - weighted_mean) ** 2)
+    degrees_of_freedom = num_realisations - 1
+    return chi_square <= degrees_of_freedom + CONSISTENCY_SIGMAS * np.sqrt(2.0 * degrees_of_freedom)
+
+
+@njit(inline='always')
+def equilibrate(solver, spin, temperature, max_eq_steps, num_window_steps, detect, seed,
+                temperature_index, realisation, normals, solver_args=()):
+    """Returns (spin, steps, detected) after advancing spin through the equilibration of a
+    realisation, which is max_eq_steps unless detect is True, in which case it stops at the end of
+    the first window of num_window_steps steps after which the z-component has_equilibrated, and
+    whether it did.
+
+    normals is the rng.NOISE_BLOCK buffer of the realisation, so production continues the noise
+    stream from the step returned.
+    """
+    window_means = np.empty((1, max(1, max_eq_steps // num_window_steps)))
+    num_windows = 0
+    window_sum = 0.0
+    detected = False
+
+    step = 0
+    while step < max_eq_steps:
+        if step % rng.NOISE_BLOCK == 0:
+            rng.normal_block(seed, temperature_index, realisation, step, normals)
+
+        spin = solver(spin, temperature, normals[step % rng.NOISE_BLOCK], *solver_args)
+        step += 1
+
+        if detect:
+            window_sum += spin[2]
+            if step % num_window_steps == 0:
+                window_means[0, num_windows] = window_sum / num_window_steps
+                num_windows += 1
+                window_sum = 0.0
+                if has_equilibrated(window_means[:, :num_windows]):
+                    detected = True
+                    break
+
+    return spin, step, detected
+
+
+@njit(inline='always')
+def equilibrate_realisations(solver, spins, temperature, max_eq_steps, num_window_steps, seed, temperature_index,
+                             normals, solver_args=()):
+    """Returns (steps, detected) after advancing the rows of spins, the realisations at the
+    temperature, together window by window of num_window_steps steps until they have_equilibrated,
+    judged on all of them at once, or for max_eq_steps, and whether they were detected to have.
+
+    normals is the (realisations, rng.NOISE_BLOCK, 3) buffer of their noise, so production continues
+    the noise streams from the step returned.
+    """
+    num_realisations = spins.shape[0]
+    window_means = np.empty((num_realisations, max(1, max_eq_steps // num_window_steps)))
+    num_windows = 0
+    detected = False
+
+    step = 0
+    while step < max_eq_steps and not detected:
+        last_step = min(step + num_window_steps, max_eq_steps)
+        full_window = last_step - step == num_window_steps
+        for r in range(num_realisations):
+            window_sum = 0.0
+            for window_step in range(step, last_step):
+                if window_step % rng.NOISE_BLOCK == 0:
+                    rng.normal_block(seed, temperature_index, r, window_step, normals[r])
+
+                spins[r] = solver(spins[r], temperature, normals[r, window_step % rng.NOISE_BLOCK], *solver_args)
+                window_sum += spins[r, 2]
+            if full_window:
+                window_means[r, num_windows] = window_sum / num_window_steps
+
+        if full_window:
+            num_windows += 1
+            detected = has_equilibrated(window_means[:, :num_windows])
+        step = last_step
+
+    return step, detected
+
+
+@njit(inline='always')
+def compute_temperature_dependence_detected(solver, temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, seed=None, solver_args=()):
+    """Returns (sz, equilibration_steps, capped): the expectation values of
+    compute_temperature_dependence, with the realisations of each temperature equilibrating together
+    only until they are detected to have equilibrated (see equilibrate_realisations), the
+    (temperatures, realisations) array of the number of equilibration steps each discarded, and
+    whether each temperature ran out of its budget, EQUILIBRATION_BUDGET times equilibration_time,
+    without being detected to have equilibrated.
+
+    Every other realisation starts from spin_initial mirrored in the xy-plane, so that the
+    realisations start in both wells of the anisotropy: a temperature at which the spin cannot
+    cross the barrier then never agrees across realisations, and is capped, rather than being
+    detected to have equilibrated in the well it started in.
+    """
+    key = rng.random_seed() if seed is None else seed
+
+    num_temperatures = temperatures.shape[0]
+    num_window_steps = max(1, int(WINDOW_TIME / time_step))
+    max_eq_steps = int(EQUILIBRATION_BUDGET * equilibration_time / time_step)
+    num_production_steps = int(production_time / time_step)
+
+    sz_expectation = np.zeros(num_temperatures)
+    equilibration_steps = np.zeros((num_temperatures, num_realisation), dtype=np.int64)
+    capped = np.zeros(num_temperatures, dtype=np.bool_)
+
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
+
+    spins = np.empty((num_realisation, 3))
+    normals = np.empty((num_realisation, rng.NOISE_BLOCK, 3))
+    for i in range(num_temperatures):
+        for r in range(num_realisation):
+            spins[r] = rescale_spin(spin_initial)
+            if r % 2 == 1:
+                spins[r, 2] = -spins[r, 2]
+        num_eq_steps, detected = equilibrate_realisations(solver, spins, temperatures[i], max_eq_steps,
+                                                          num_window_steps, key, i, normals, solver_args)
+        equilibration_steps[i, :] = num_eq_steps
+        capped[i] = not detected
+
+        for r in range(num_realisation):
+            spin = spins[r].copy()
+            spin_z = 0.0
+            for step in range(num_eq_steps, num_eq_steps + num_production_steps):
+                if step % rng.NOISE_BLOCK == 0:
+                    rng.normal_block(key, i, r, step, normals[r])
+
+                spin = solver(spin, temperatures[i], normals[r, step % rng.NOISE_BLOCK], *solver_args)
+                spin_z += spin[2]
+            sz_expectation[i] += spin_z / num_production_steps
+        sz_expectation[i] = renormalisation * sz_expectation[i] / num_realisation
+
+    return sz_expectation, equilibration_steps, capped
+
+
+@njit(inline='always')
+def calculate_sz_adaptive(solver, spin_initial, temperature, num_eq_steps, num_production_steps,
+                          num_realisations, num_block_steps, num_window_steps, tolerance, detect_equilibration, seed,
+                          temperature_index, solver_args=()):
+    """Returns (sz, standard error, production steps, equilibration steps, capped) for the expectation
+    value of the z-component of the spin, stopping as soon as the blocking standard error is at most
+    tolerance, capped being whether a realisation detecting its equilibration ran out of num_eq_steps.
+
+    The realisations are interleaved, each advancing by a block of num_block_steps steps in turn up
+    to num_production_steps, so the standard error is always that of the block means of all of
+    them, each realisation's in time order, and spreads between realisations are not missed. Each
+    realisation equilibrates for num_eq_steps or, if detect_equilibration, until it is detected to
+    have equilibrated on windows of num_window_steps (see equilibrate). The noise streams are those
+    of calculate_sz_asd, so a run with a fixed equilibration which never converges gives the same
+    sz as calculate_sz_asd when num_production_steps is a multiple of num_block_steps.
+    """
+    num_realisation_blocks = num_production_steps // num_block_steps
+    block_means = np.empty((num_realisations, num_realisation_blocks))
+    pooled = np.empty(num_realisations * num_realisation_blocks)
+    equilibration_steps = 0
+    capped = False
+
+    spins = np.empty((num_realisations, 3))
+    first_steps = np.empty(num_realisations, dtype=np.int64)
+    normals = np.empty((num_realisations, rng.NOISE_BLOCK, 3))
+    for realisation in range(num_realisations):
+        spins[realisation], first_steps[realisation], detected = equilibrate(
+            solver, rescale_spin(spin_initial), temperature, num_eq_steps, num_window_steps, detect_equilibration,
+            seed, temperature_index, realisation, normals[realisation], solver_args)
+        equilibration_steps += first_steps[realisation]
+        capped = capped or (detect_equilibration and not detected)
+
+    num_blocks = 0
+    for block in range(num_realisation_blocks):
+        for realisation in range(num_realisations):
+            spin = spins[realisation].copy()
+            block_sum = 0.0
+            first_step = first_steps[realisation] + block * num_block_steps
+            for step in range(first_step, first_step + num_block_steps):
+                if step % rng.NOISE_BLOCK == 0:
+                    rng.normal_block(seed, temperature_index, realisation, step, normals[realisation])
+
+                spin = solver(spin, temperature, normals[realisation, step % rng.NOISE_BLOCK], *solver_args)
+                block_sum += spin[2]
+            spins[realisation] = spin
+            block_means[realisation, block] = block_sum / num_block_steps
+
+        num_blocks = (block + 1) * num_realisations
+        for realisation in range(num_realisations):
+            pooled[realisation * (block + 1):(realisation + 1) * (block + 1)] = block_means[realisation, :block + 1]
+        if num_blocks >= MIN_BLOCKS and blocking_standard_error(pooled[:num_blocks]) <= tolerance:
+            break
+
+    return (np.mean(pooled[:num_blocks]), blocking_standard_error(pooled[:num_blocks]),
+            num_blocks * num_block_steps, equilibration_steps, capped)
+
+
+@njit(inline='always')
+def compute_temperature_dependence_adaptive(solver, temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation,
+                                            spin_initial, tolerance, detect_equilibration, seed=None,
+                                            solver_args=()):
+    """Returns the arrays (sz, sz_error, production_steps, equilibration_steps, capped) of the
+    expectation values of the z-component of the spin at the temperatures, their standard errors,
+    the numbers of production and (discarded) equilibration steps they took, summed over
+    realisations, and whether a realisation ran out of its equilibration without being detected to
+    have equilibrated. Each temperature stops as soon as its standard error is at most tolerance,
+    with production_time per realisation and num_realisation realisations as the budget. If
+    detect_equilibration each realisation equilibrates until it is detected to have, for at most
+    EQUILIBRATION_BUDGET times equilibration_time (see calculate_sz_adaptive).
+    """
+    key = rng.random_seed() if seed is None else seed
+
+    num_temperatures = temperatures.shape[0]
+    num_block_steps = max(1, int(BLOCK_TIME / time_step))
+    num_window_steps = max(1, int(WINDOW_TIME / time_step))
+    max_eq_steps = int((EQUILIBRATION_BUDGET if detect_equilibration else 1.0) * equilibration_time / time_step)
+
+    sz_expectation = np.zeros(num_temperatures)
+    sz_error = np.zeros(num_temperatures)
+    production_steps = np.zeros(num_temperatures, dtype=np.int64)
+    equilibration_steps = np.zeros(num_temperatures, dtype=np.int64)
+    capped = np.zeros(num_temperatures, dtype=np.bool_)
+
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
+
+    for i in range(num_temperatures):
+        sz, standard_error, production_steps[i], equilibration_steps[i], capped[i] = calculate_sz_adaptive(
+            solver, spin_initial, temperatures[i], max_eq_steps, int(production_time / time_step), num_realisation,
+            num_block_steps, num_window_steps, tolerance, detect_equilibration, key, i, solver_args)
+        sz_expectation[i] = renormalisation * sz
+        sz_error[i] = renormalisation * standard_error
+
+    return sz_expectation, sz_error, production_steps, equilibration_steps, capped
+
+
+# Annealing
+@njit(inline='always')
+def anneal_realisation(solver, spin_initial, temperatures, num_eq_steps, num_reeq_steps, num_production_steps,
+                       seed, realisation, spin_z, equilibration_steps, solver_args=()):
+    """Runs one realisation through the temperatures in turn, starting each from the final spin at
+    the previous one, and stores its time average and equilibration steps at temperatures[i] in
+    spin_z[i] and equilibration_steps[i].
+
+    The first temperature equilibrates from spin_initial for num_eq_steps. Every later one
+    equilibrates for num_reeq_steps, the MIN_EQUILIBRATION_WINDOWS windows first judged by
+    has_equilibrated, and then window by window until it has equilibrated, so that a carried spin
+    still far from equilibrium gets up to num_eq_steps.
+    """
+    num_window_steps = max(1, num_reeq_steps // MIN_EQUILIBRATION_WINDOWS)
+    normals = np.empty((rng.NOISE_BLOCK, 3))
+    spin = rescale_spin(spin_initial)
+
+    for i in range(temperatures.shape[0]):
+        spin, equilibration_steps[i], _ = equilibrate(solver, spin, temperatures[i], num_eq_steps, num_window_steps,
+                                                      i > 0, seed, i, realisation, normals, solver_args)
+
+        sz = 0.0
+        for step in range(equilibration_steps[i], equilibration_steps[i] + num_production_steps):
+            if step % rng.NOISE_BLOCK == 0:
+                rng.normal_block(seed, i, realisation, step, normals)
+
+            spin = solver(spin, temperatures[i], normals[step % rng.NOISE_BLOCK], *solver_args)
+            sz += spin[2]
+        spin_z[i] = sz / num_production_steps
+
+
+@njit(inline='always')
+def compute_temperature_dependence_annealed(solver, temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, reequilibration_time, production_time,
+                                            num_realisation, spin_initial, seed=None, solver_args=()):
+    """Returns (sz, equilibration_steps): the expectation values of the z-component of the spin at
+    the temperatures, walked in the order given with each realisation carried from one temperature
+    to the next (see anneal_realisation), and the (temperatures, realisations) array of the number
+    of equilibration steps each discarded.
+
+    Only the first temperature equilibrates for equilibration_time, the others for
+    reequilibration_time unless they are detected not to have equilibrated by then. Walking from
+    high to low temperature, where the spin is slowest to equilibrate, removes most of the
+    equilibration of a fine grid.
+    """
+    key = rng.random_seed() if seed is None else seed
+
+    num_temperatures = temperatures.shape[0]
+    spin_z = np.zeros((num_temperatures, num_realisation))
+    equilibration_steps = np.zeros((num_temperatures, num_realisation), dtype=np.int64)
+
+    for r in range(num_realisation):
+        anneal_realisation(solver, spin_initial, temperatures, int(equilibration_time / time_step),
+                           int(reequilibration_time / time_step), int(production_time / time_step), key, r,
+                           spin_z[:, r], equilibration_steps[:, r], solver_args)
+
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
+
+    sz_expectation = np.zeros(num_temperatures)
+    for i in range(num_temperatures):
+        sz_expectation[i] = renormalisation * np.mean(spin_z[i])
+
+    return sz_expectation, equilibration_steps
+
+
+# Adaptive time step
+STEP_SAFETY = 0.9  # fraction of the step predicted to meet the tolerance which is taken
+STEP_GROWTH_LIMIT = 5.0  # largest factor by which the step changes from one step to the next
+STEP_SHRINK_LIMIT = 0.2
+MIN_STEP_FACTOR = 0.01  # bounds of the step as multiples of the initial time step
+MAX_STEP_FACTOR = 100.0
+
+
+@njit(inline='always')
+def calculate_sz_realisation_adaptive_step(field, spin_initial, temperature, equilibration_time, production_time,
+                                           step_tolerance, seed, temperature_index, realisation, integrator,
+                                           quantum_spin, a_1, a_2, alpha, time_step):
+    """Returns (sz, steps): the time average of the z-component of the spin for a single
+    realisation of the noise integrated with heun_step or geometric_heun_step (integrator HEUN or
+    GEOMETRIC_HEUN) with an adaptive time step, and the number of steps taken.
+
+    Each step is chosen from the embedded error estimate of the previous one, so that the local
+    error is close to step_tolerance, within [MIN_STEP_FACTOR, MAX_STEP_FACTOR] * time_step. The
+    step never depends on its own noise, which would bias the average, and the average is
+    weighted by the step lengths.
+    """
+    beta = 1.0 / (kB * temperature)
+    sx, sy, sz = normalised(spin_initial[0], spin_initial[1], spin_initial[2])
+
+    normals = np.empty((rng.NOISE_BLOCK, 3))
+    step_size = time_step
+    elapsed_time = 0.0
+    production_elapsed_time = 0.0
+    spin_z = 0.0
+    step = 0
+    while elapsed_time < equilibration_time + production_time:
+        if step % rng.NOISE_BLOCK == 0:
+            rng.normal_block(seed, temperature_index, realisation, step, normals)
+
+        gamma = noise_amplitude(step_size, temperature, alpha, quantum_spin)
+        normal = normals[step % rng.NOISE_BLOCK]
+        if integrator == GEOMETRIC_HEUN:
+            sx, sy, sz, error = geometric_heun_step(sx, sy, sz, field, beta, gamma, normal[0], normal[1], normal[2],
+                                                    a_1, a_2, step_size, alpha)
+        else:
+            sx, sy, sz, error = heun_step(sx, sy, sz, field, beta, gamma, normal[0], normal[1], normal[2],
+                                          a_1, a_2, step_size, alpha)
+
+        if elapsed_time >= equilibration_time:
+            spin_z += sz * step_size
+            production_elapsed_time += step_size
+        elapsed_time += step_size
+        step += 1
+
+        factor = STEP_GROWTH_LIMIT
+        if error > 0.0:
+            factor = min(STEP_GROWTH_LIMIT, max(STEP_SHRINK_LIMIT, STEP_SAFETY * np.sqrt(step_tolerance / error)))
+        step_size = min(MAX_STEP_FACTOR * time_step, max(MIN_STEP_FACTOR * time_step, factor * step_size))
+
+    return spin_z / production_elapsed_time, step
+
+
+@njit(inline='always')
+def compute_temperature_dependence_adaptive_step(field, temperatures, low_high_t, quantum_spin,
+                                                 equilibration_time, production_time, num_realisation,
+                                                 spin_initial, step_tolerance, seed, solver_args):
+    """Returns (sz, steps): the expectation values of the z-component of the spin at the
+    temperatures, integrated with an adaptive time step (see
+    calculate_sz_realisation_adaptive_step), and the number of steps each temperature took over
+    all realisations. solver_args are those of solver_arguments for the heun or geometric-heun
+    integrator, its time step being the initial step. field is a z-field function from
+    field_factory.
+    """
+    integrator, _, a_1, a_2, alpha, time_step = solver_args
+    key = rng.random_seed() if seed is None else seed
+
+    sz_expectation = np.zeros(temperatures.shape[0])
+    steps = np.zeros(temperatures.shape[0], dtype=np.int64)
+
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
+
+    for i in range(temperatures.shape[0]):
+        for r in range(num_realisation):
+            sz, realisation_steps = calculate_sz_realisation_adaptive_step(
+                field, spin_initial, temperatures[i], equilibration_time, production_time, step_tolerance, key,
+                i, r, integrator, quantum_spin, a_1, a_2, alpha, time_step)
+            sz_expectation[i] += sz
+            steps[i] += realisation_steps
+        sz_expectation[i] = renormalisation * sz_expectation[i] / num_realisation
+
+    return sz_expectation, steps
+
+
+# Quadrature
+def spectral_integration_matrix(nodes):
+    """Returns the matrix S for which Sum_j S[k, j] f(nodes[j]) is the integral from -1 to nodes[k]
+    of the polynomial through the values of f at the nodes"""
+    lagrange_coefficients = np.linalg.inv(np.polynomial.legendre.legvander(nodes, nodes.shape[0] - 1))
+    lagrange_integrals = np.polynomial.legendre.legint(lagrange_coefficients, lbnd=-1)
+    return np.polynomial.legendre.legval(nodes, lagrange_integrals).T
+
+
+GAUSS_LEGENDRE_NODES, GAUSS_LEGENDRE_WEIGHTS = np.polynomial.legendre.leggauss(16)
+GAUSS_LEGENDRE_INTEGRATION = spectral_integration_matrix(GAUSS_LEGENDRE_NODES)
+QUADRATURE_TOLERANCE = 1e-10  # change in <n_z> between successive refinements at which to stop
+QUADRATURE_MIN_PANELS = 8
+QUADRATURE_MAX_PANELS = 2**14
+
+
+@njit(inline='always')
+def quadrature_sz(field, beta, quantum_spin, a_1, a_2, num_panels):
+    """Returns the equilibrium expectation value of n_z sampled by the spin dynamics,
+
+    <n_z> = ∫ n_z exp(-β H_eff(n_z)) dn_z / ∫ exp(-β H_eff(n_z)) dn_z  over n_z in [-1, 1]
+
+    with -β H_eff(n_z) = β s g μ_B ∫ field dn_z, by Gauss-Legendre quadrature on num_panels equal
+    panels. The exponent at each node is integrated from the field at the nodes of its panel, and
+    the weights are taken relative to the largest so that they cannot overflow at low temperature.
+    """
+    order = GAUSS_LEGENDRE_NODES.shape[0]
+    width = 2.0 / num_panels
+    scale = beta * quantum_spin * g_factor * muB
+
+    positions = np.empty((num_panels, order))
+    exponents = np.empty((num_panels, order))
+    fields = np.empty(order)
+    potential = 0.0  # ∫ field dn_z from -1 to the start of the panel
+    for panel in range(num_panels):
+        start = -1.0 + panel * width
+        for j in range(order):
+            positions[panel, j] = start + 0.5 * width * (1.0 + GAUSS_LEGENDRE_NODES[j])
+            fields[j] = field(beta, a_2, a_1, positions[panel, j], g_factor, muB)
+
+        for k in range(order):
+            partial = 0.0
+            for j in range(order):
+                partial += GAUSS_LEGENDRE_INTEGRATION[k, j] * fields[j]
+            exponents[panel, k] = scale * (potential + 0.5 * width * partial)
+
+        for j in range(order):
+            potential += 0.5 * width * GAUSS_LEGENDRE_WEIGHTS[j] * fields[j]
+
+    largest_exponent = np.max(exponents)
+    partition_function = 0.0
+    sz = 0.0
+    for panel in range(num_panels):
+        for k in range(order):
+            weight = GAUSS_LEGENDRE_WEIGHTS[k] * np.exp(exponents[panel, k] - largest_exponent)
+            partition_function += weight
+            sz += weight * positions[panel, k]
+
+    return sz / partition_function
+
+
+@njit(inline='always')
+def calculate_sz_quadrature(field, temperature, quantum_spin, a_1, a_2):
+    """Returns the equilibrium <n_z> of quadrature_sz, doubling the number of panels from
+    QUADRATURE_MIN_PANELS until it changes by at most QUADRATURE_TOLERANCE"""
+    beta = 1.0 / (kB * temperature)
+    num_panels = QUADRATURE_MIN_PANELS
+    sz = quadrature_sz(field, beta, quantum_spin, a_1, a_2, num_panels)
+    while num_panels < QUADRATURE_MAX_PANELS:
+        num_panels *= 2
+        refined_sz = quadrature_sz(field, beta, quantum_spin, a_1, a_2, num_panels)
+        if abs(refined_sz - sz) <= QUADRATURE_TOLERANCE:
+            return refined_sz
+        sz = refined_sz
+
+    return sz
+
+
+@njit(inline='always')
+def compute_temperature_dependence_quadrature(field, temperatures, low_high_t, quantum_spin, a_1, a_2):
+    """Returns the expectation values of the z-component of the spin at the temperatures which
+    compute_temperature_dependence converges to, evaluated deterministically from the stationary
+    distribution of the dynamics (see quadrature_sz). field is a z-field function from
+    field_factory.
+    """
+    sz_expectation = np.zeros(temperatures.shape[0])
+
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
+
+    for i in range(temperatures.shape[0]):
+        sz_expectation[i] = renormalisation * calculate_sz_quadrature(field, temperatures[i], quantum_spin,
+                                                                      a_1, a_2)
+
+    return sz_expectation
+
+
+# Replica exchange
+EXCHANGE_TIME = 0.01  # ns between attempts to swap the spins of neighbouring temperatures
+EXCHANGE_PANELS = 8  # Gauss-Legendre panels of the integral of the field in exchange_log_ratio
+
+
+@njit(inline='always')
+def field_integral(field, beta, a_1, a_2, lower, upper):
+    """Returns the integral of the z-field from n_z = lower to upper by Gauss-Legendre quadrature
+    on EXCHANGE_PANELS equal panels"""
+    width = (upper - lower) / EXCHANGE_PANELS
+    integral = 0.0
+    for panel in range(EXCHANGE_PANELS):
+        start = lower + panel * width
+        for j in range(GAUSS_LEGENDRE_NODES.shape[0]):
+            n_z = start + 0.5 * width * (1.0 + GAUSS_LEGENDRE_NODES[j])
+            integral += 0.5 * width * GAUSS_LEGENDRE_WEIGHTS[j] * field(beta, a_2, a_1, n_z, g_factor, muB)
+    return integral
+
+
+@njit(inline='always')
+def exchange_log_ratio(field, temperature_1, temperature_2, n_z_1, n_z_2, quantum_spin, a_1, a_2):
+    """Returns the logarithm of the Metropolis ratio for swapping the spin with z-component n_z_1
+    at temperature_1 with the one with n_z_2 at temperature_2,
+
+    ln r = β₁ (H_eff,1(n_z_1) - H_eff,1(n_z_2)) + β₂ (H_eff,2(n_z_2) - H_eff,2(n_z_1))
+
+    with -β H_eff(n_z) = β s g μ_B ∫ field dn_z the exponent of the distribution the dynamics
+    sample (see quadrature_sz). The effective Hamiltonian depends on the temperature through the
+    field, so each temperature integrates its own.
+    """
+    beta_1 = 1.0 / (kB * temperature_1)
+    beta_2 = 1.0 / (kB * temperature_2)
+    return quantum_spin * g_factor * muB * (beta_1 * field_integral(field, beta_1, a_1, a_2, n_z_1, n_z_2)
+                                            - beta_2 * field_integral(field, beta_2, a_1, a_2, n_z_1, n_z_2))
+
+
+@njit(inline='always')
+def compute_temperature_dependence_exchange(solver, field, temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation, spin_initial,
+                                            exchange_time, seed, solver_args):
+    """Returns (sz, acceptance): the expectation values of compute_temperature_dependence_ensemble,
+    with the spins of neighbouring temperatures of each realisation swapped every exchange_time
+    with the Metropolis probability min(1, r) of exchange_log_ratio (replica exchange, or parallel
+    tempering), and the fraction of the swaps of each of the len(temperatures) - 1 neighbouring
+    pairs that were accepted.
+
+    A spin stuck in one well at a low temperature is swapped up to a temperature at which it
+    crosses the barrier and comes back in the other, so the wells are sampled in proportion to
+    their weights without longer runs. The temperatures must be sorted. The even and odd pairs are
+    tried in turn, from the start of the equilibration, each test drawing its uniform number from
+    rng.exchange_uniform. solver is an ensemble solver and field the z-field function it uses,
+    solver_args being those of solver_arguments.
+    """
+    _, _, a_1, a_2, _, _ = solver_args
+    key = rng.random_seed() if seed is None else seed
+
+    num_temperatures = temperatures.shape[0]
+    num_eq_steps = int(equilibration_time / time_step)
+    num_steps = num_eq_steps + int(production_time / time_step)
+    num_exchange_steps = max(1, int(exchange_time / time_step))
+
+    spins, ensemble_temperatures, temperature_indices, realisations = initial_ensemble(temperatures,
+                                                                                       num_realisation,
+                                                                                       spin_initial)
+    spin_z = np.zeros(spins.shape[0])
+    accepted = np.zeros(max(1, num_temperatures - 1))
+    attempted = np.zeros(max(1, num_temperatures - 1))
+
+    step = 0
+    exchange = 0
+    while step < num_steps:
+        last_step = min(step + num_exchange_steps, num_steps)
+        advance_ensemble(solver, spins, ensemble_temperatures, step, last_step, num_eq_steps, key,
+                         temperature_indices, realisations, spin_z, solver_args)
+        step = last_step
+
+        for pair in range(exchange % 2, num_temperatures - 1, 2):
+            for r in range(num_realisation):
+                row_1 = pair * num_realisation + r
+                row_2 = row_1 + num_realisation
+                log_ratio = exchange_log_ratio(field, temperatures[pair], temperatures[pair + 1],
+                                               spins[row_1, 2], spins[row_2, 2], quantum_spin, a_1, a_2)
+                attempted[pair] += 1
+                if log_ratio >= 0.0 or rng.exchange_uniform(key, r, exchange, pair) < np.exp(log_ratio):
+                    accepted[pair] += 1
+                    for k in range(3):
+                        spins[row_1, k], spins[row_2, k] = spins[row_2, k], spins[row_1, k]
+        exchange += 1
+
+    sz_expectation = ensemble_average(spin_z / (num_steps - num_eq_steps), num_temperatures, num_realisation,
+                                      renormalisation_factor(low_high_t, quantum_spin))
+
+    return sz_expectation, accepted[:num_temperatures - 1] / np.maximum(attempted[:num_temperatures - 1], 1.0)
+
+
+# Observables
+# recorded by accumulate_observables, see observable_values
+OBSERVABLES = ('sz', 'sz_square', 'energy', 'moment', 'sz_moment')
+OBSERVABLE_SZ_POWERS = (1, 2, 0, 0, 1)  # power of S_z in each, which sets how it is renormalised
+OBSERVABLES_DTYPE = np.dtype([('temperature', np.float64)]
+                             + [(f'{name}{suffix}', np.float64) for name in OBSERVABLES
+                                for suffix in ('', '_error', '_variance')])
+ENERGY_TABLE_INTERVALS = 1024  # intervals of n_z on which H_eff is tabulated by effective_energy_table
+MOMENT_FIELD_STEP = 1e-4  # Tesla, field step of the central difference of observable_tables
+
+
+@njit(inline='always')
+def effective_energy_table(field, beta, quantum_spin, a_1, a_2):
+    """Returns the effective Hamiltonian H_eff(n_z) = -s g μ_B ∫ field dn_z from 0 to n_z, in Joules,
+    at the ENERGY_TABLE_INTERVALS + 1 equally spaced n_z from -1 to 1. Each interval is integrated
+    by Gauss-Legendre quadrature. For the classical limit this is the classical energy without A_0.
+    """
+    width = 2.0 / ENERGY_TABLE_INTERVALS
+    table = np.zeros(ENERGY_TABLE_INTERVALS + 1)
+    for k in range(ENERGY_TABLE_INTERVALS):
+        start = -1.0 + k * width
+        integral = 0.0
+        for j in range(GAUSS_LEGENDRE_NODES.shape[0]):
+            n_z = start + 0.5 * width * (1.0 + GAUSS_LEGENDRE_NODES[j])
+            integral += 0.5 * width * GAUSS_LEGENDRE_WEIGHTS[j] * field(beta, a_2, a_1, n_z, g_factor, muB)
+        table[k + 1] = table[k] - quantum_spin * g_factor * muB * integral
+
+    return table - table[ENERGY_TABLE_INTERVALS // 2]
+
+
+@njit(inline='always')
+def observable_tables(field, beta, quantum_spin, a_1, a_2):
+    """Returns the (2, ENERGY_TABLE_INTERVALS + 1) array of the effective_energy_table and of the
+    moment -∂H_eff/∂B (in J/T, B the applied field), the latter by a central difference in A_1 = g μ_B B.
+    In the classical limit the moment is s g μ_B n_z, for the quantum approximations the field
+    depends on A_1 through the Boltzmann factors as well.
+
+    Both tables are zero at n_z = 0, the moment because it is the derivative of the energy table,
+    which is. The moment is therefore relative to its value at n_z = 0. In the classical limit that
+    value is 0, but for the quantum approximations the part of the moment which does not depend on
+    n_z is left out. This offsets <M> and <n_z M>, but not the variance of M or the susceptibility
+    of fluctuation_response, which only depend on the fluctuations.
+    """
+    step = g_factor * muB * MOMENT_FIELD_STEP
+    tables = np.empty((2, ENERGY_TABLE_INTERVALS + 1))
+    tables[0] = effective_energy_table(field, beta, quantum_spin, a_1, a_2)
+    tables[1] = g_factor * muB * (effective_energy_table(field, beta, quantum_spin, a_1 - step, a_2)
+                                  - effective_energy_table(field, beta, quantum_spin, a_1 + step, a_2)) / (2.0 * step)
+    return tables
+
+
+@njit
+def interpolate_table(table, n_z):
+    """Returns the value at n_z linearly interpolated from a table of effective_energy_table's grid"""
+    x = 0.5 * (n_z + 1.0) * ENERGY_TABLE_INTERVALS
+    k = min(max(int(x), 0), ENERGY_TABLE_INTERVALS - 1)
+    return table[k] + (x - k) * (table[k + 1] - table[k])
+
+
+@njit
+def observable_values(spin, tables, values):
+    """Fills values with the OBSERVABLES of the spin, tables being its observable_tables. This is
+    the place to add another."""
+    values[0] = spin[2]
+    values[1] = spin[2] * spin[2]
+    values[2] = interpolate_table(tables[0], spin[2])
+    values[3] = interpolate_table(tables[1], spin[2])
+    values[4] = spin[2] * values[3]
+
+
+@njit(inline='always')
+def accumulate_observables(solver, spin_initial, temperature, tables, num_eq_steps, num_production_steps,
+                           num_block_steps, seed, temperature_index, realisation, sums, means, squares,
+                           block_means, num_blocks, solver_args=()):
+    """Runs one realisation of calculate_sz_realisation and adds every OBSERVABLE of each
+    production step to the accumulators, returning the new number of blocks:
+
+    sums     the sum over steps of each observable
+    means    its running mean and squares its running sum of squared deviations (Welford's
+             algorithm, which does not lose the variance to cancellation)
+    block_means  the means of consecutive blocks of num_block_steps steps, for blocking errors
+
+    The running means and squares count the steps already accumulated as sums[0]'s count, i.e.
+    realisation * num_production_steps.
+    """
+    spin = rescale_spin(spin_initial)
+    values = np.empty(len(OBSERVABLES))
+    block_sums = np.zeros(len(OBSERVABLES))
+    count = realisation * num_production_steps
+
+    normals = np.empty((rng.NOISE_BLOCK, 3))
+    for step in range(0, num_eq_steps + num_production_steps):
+        if step % rng.NOISE_BLOCK == 0:
+            rng.normal_block(seed, temperature_index, realisation, step, normals)
+
+        spin = solver(spin, temperature, normals[step % rng.NOISE_BLOCK], *solver_args)
+
+        if step >= num_eq_steps:
+            observable_values(spin, tables, values)
+            count += 1
+            for k in range(len(OBSERVABLES)):
+                sums[k] += values[k]
+                deviation = values[k] - means[k]
+                means[k] += deviation / count
+                squares[k] += deviation * (values[k] - means[k])
+                block_sums[k] += values[k]
+
+            if (step - num_eq_steps + 1) % num_block_steps == 0:
+                for k in range(len(OBSERVABLES)):
+                    block_means[k, num_blocks] = block_sums[k] / num_block_steps
+                    block_sums[k] = 0.0
+                num_blocks += 1
+
+    return num_blocks
+
+
+@njit(inline='always')
+def compute_temperature_dependence_observables(solver, field, temperatures, low_high_t, quantum_spin, time_step,
+                                               equilibration_time, production_time, num_realisation,
+                                               spin_initial, seed, solver_args):
+    """Returns a structured array of OBSERVABLES_DTYPE holding, for each temperature, the mean of
+    each of the OBSERVABLES over the production steps of every realisation, its standard error
+    (blocking_standard_error of the pooled means of blocks of BLOCK_TIME) and its variance, all
+    from one pass of the dynamics of compute_temperature_dependence with the same noise streams.
+
+    The sz means equal those of compute_temperature_dependence up to rounding, and S_z moments are
+    renormalised likewise. The energy and moment are those of observable_tables. solver
+    is a solver and field the z-field function it uses, solver_args being those of
+    solver_arguments.
+    """
+    _, _, a_1, a_2, _, _ = solver_args
+    key = rng.random_seed() if seed is None else seed
+
+    num_eq_steps = int(equilibration_time / time_step)
+    num_production_steps = int(production_time / time_step)
+    num_block_steps = max(1, int(BLOCK_TIME / time_step))
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
+
+    # the columns of OBSERVABLES_DTYPE, viewed as the structured array at the end
+    observables = np.zeros((temperatures.shape[0], 1 + 3 * len(OBSERVABLES)))
+    block_means = np.empty((len(OBSERVABLES), num_realisation * (num_production_steps // num_block_steps)))
+    for i in range(temperatures.shape[0]):
+        tables = observable_tables(field, 1.0 / (kB * temperatures[i]), quantum_spin, a_1, a_2)
+
+        sums = np.zeros(len(OBSERVABLES))
+        means = np.zeros(len(OBSERVABLES))
+        squares = np.zeros(len(OBSERVABLES))
+        num_blocks = 0
+        for r in range(num_realisation):
+            num_blocks = accumulate_observables(solver, spin_initial, temperatures[i], tables, num_eq_steps,
+                                                num_production_steps, num_block_steps, key, i, r, sums, means,
+                                                squares, block_means, num_blocks, solver_args)
+
+        observables[i, 0] = temperatures[i]
+        for k in range(len(OBSERVABLES)):
+            scale = renormalisation ** OBSERVABLE_SZ_POWERS[k]
+            observables[i, 1 + 3 * k] = scale * sums[k] / (num_realisation * num_production_steps)
+            observables[i, 2 + 3 * k] = scale * blocking_standard_error(block_means[k, :num_blocks])
+            observables[i, 3 + 3 * k] = scale**2 * squares[k] / (num_realisation * num_production_steps)
+
+    return observables.view(OBSERVABLES_DTYPE)[:, 0]
+
+
+def fluctuation_response(observables):
+    """Returns (susceptibility, heat_capacity) at the temperatures of a structured array of
+    compute_temperature_dependence_observables, from the equilibrium fluctuations of the same run
+    rather than by differencing runs at several fields or temperatures:
+
+    susceptibility = d<n_z>/dB = β (<n_z M> - <n_z><M>)   (per Tesla, M = -∂H_eff/∂B the moment)
+    heat_capacity  = β² (<H_eff²> - <H_eff>²)             (in units of k_B)
+
+    The susceptibility is exact for the distribution of every approximation (in the classical limit
+    M = s g μ_B n_z and it is β s g μ_B Var(n_z)). The heat capacity is that of the effective
+    Hamiltonian at fixed temperature, which is the full dE/dT only in the classical limit, where
+    H_eff does not depend on the temperature. Compare with analytic.quantum_state_susceptibility
+    and analytic.quantum_state_heat_capacity.
+    """
+    beta = 1.0 / (kB * observables['temperature'])
+    susceptibility = beta * (observables['sz_moment'] - observables['sz'] * observables['moment'])
+    heat_capacity = beta**2 * observables['energy_variance']
+    return susceptibility, heat_capacity
+
+
+# Histograms
+HISTOGRAM_BINS = ENERGY_TABLE_INTERVALS  # equal bins of n_z in [-1, 1], the intervals of effective_energy_table
+
+
+@njit(inline='always')
+def compute_temperature_dependence_histogram(solver, temperatures, low_high_t, quantum_spin, time_step,
+                                             equilibration_time, production_time, num_realisation, spin_initial,
+                                             seed=None, solver_args=()):
+    """Returns (sz, histograms): the expectation values of compute_temperature_dependence, from the
+    same noise streams, and the (temperatures, HISTOGRAM_BINS) array of the number of production
+    steps of all realisations in which n_z fell in each bin, for reweighting.py.
+    """
+    key = rng.random_seed() if seed is None else seed
+
+    num_eq_steps = int(equilibration_time / time_step)
+    num_production_steps = int(production_time / time_step)
+    renormalisation = renormalisation_factor(low_high_t, quantum_spin)
+
+    sz_expectation = np.zeros(temperatures.shape[0])
+    histograms = np.zeros((temperatures.shape[0], HISTOGRAM_BINS), dtype=np.int64)
+    normals = np.empty((rng.NOISE_BLOCK, 3))
+    for i in range(temperatures.shape[0]):
+        for r in range(num_realisation):
+            spin = rescale_spin(spin_initial)
+            spin_z = 0.0
+            for step in range(num_eq_steps + num_production_steps):
+                if step % rng.NOISE_BLOCK == 0:
+                    rng.normal_block(key, i, r, step, normals)
+
+                spin = solver(spin, temperatures[i], normals[step % rng.NOISE_BLOCK], *solver_args)
+
+                if step >= num_eq_steps:
+                    spin_z += spin[2]
+                    histograms[i, min(max(int(0.5 * (spin[2] + 1.0) * HISTOGRAM_BINS), 0), HISTOGRAM_BINS - 1)] += 1
+            sz_expectation[i] += spin_z / num_production_steps
+        sz_expectation[i] = renormalisation * sz_expectation[i] / num_realisation
+
+    return sz_expectation, histograms
+
+
 def save_to_file(file_name, x_data, y_data):
     """Saves numpy arrays x and y to specified file"""
     np.savetxt(file_name, np.column_stack((x_data, y_data)), fmt='%.8e')
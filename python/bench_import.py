@@ -0,0 +1,62 @@
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+# Measures the start up time of the command line programs, i.e. the time spent importing modules
+# before any calculation starts, and whether sympy was imported. As a baseline each program is also
+# timed with sympy imported first, the start up it had when analytic.py imported sympy eagerly.
+parser = argparse.ArgumentParser(description='Benchmark the import time of pisd.py and the figure scripts.')
+
+parser.add_argument('--repeat',
+                    type=int,
+                    default=5,
+                    help='Number of fresh interpreters timed per program, the median is reported')
+
+args = parser.parse_args()
+
+# The figure scripts only calculate under __main__, so importing them times their imports alone
+PROGRAMS = {
+    'pisd.py --help': "import sys; sys.argv = ['pisd.py', '--help']\n"
+                      "try:\n    import pisd\nexcept SystemExit:\n    pass",
+    'asd': 'import asd',
+    'analytic': 'import analytic',
+    'figure_a.py': 'import figure_a',
+    'figure2_a.py': 'import figure2_a',
+    'figure3_a.py': 'import figure3_a',
+}
+
+TIMER = '''import io, sys, time, contextlib
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+{code}
+print(time.perf_counter() - start, 'sympy' in sys.modules)
+'''
+
+
+def time_import(code):
+    """Returns the median import time in seconds over args.repeat fresh interpreters, run in this
+    directory so that the modules are found from anywhere, and whether sympy was imported"""
+    indented = '\n'.join('    ' + line for line in code.splitlines())
+    times = []
+    for _ in range(args.repeat):
+        result = subprocess.run([sys.executable, '-c', TIMER.format(code=indented)],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        elapsed, sympy_imported = result.stdout.split()[-2:]
+        times.append(float(elapsed))
+    return statistics.median(times), sympy_imported == 'True'
+
+
+def main():
+    print(f'{"program":<16} {"import (s)":>10}  sympy  {"with sympy (s)":>14}  {"speed up":>8}')
+    for name, code in PROGRAMS.items():
+        elapsed, sympy_imported = time_import(code)
+        baseline, _ = time_import(f'import sympy\n{code}')
+        print(f'{name:<16} {elapsed:>10.3f}  {"yes" if sympy_imported else "no ":<5}  {baseline:>14.3f}  '
+              f'{baseline / elapsed:>7.1f}x')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import tempfile
+import statistics
+import subprocess
+import numpy as np
+import numba
+import asd
+import analytic
+
+# Separate timings of the parts that the runtime printed by pisd.py and the figure scripts lumps
+# together: integration steps, compilation, sympy derivation of the fields and the exact solution.
+# Every run appends one record to a JSON lines history file and is compared with the earlier
+# records of the same machine, so that a change which slows any of them down shows up.
+
+HISTORY_FILE = 'benchmark_history.jsonl'
+
+# order of each approximation, as for solver_module
+APPROXIMATIONS = {'classical-limit': 2, 'quantum-approximation': 3, 'quantum-exact': None}
+
+# solver_factory integrators built on spin_advance_symplectic and spin_advance_runge_kutta_4
+STEP_INTEGRATORS = ('symplectic', 'runge-kutta-4')
+
+ALPHA = 0.5
+TIME_STEP = 0.00005  # ns
+TEMPERATURE = 1.0  # K
+A_1 = asd.g_factor * asd.muB * 1.0  # 1 T
+A_2 = 1.86e-23  # J
+SPIN_INITIAL = np.array([1 / np.sqrt(3), 1.0 / np.sqrt(3), -1.0 / np.sqrt(3)])
+
+COMPILE_TIMER = '''import time
+start = time.perf_counter()
+import numpy as np
+import asd
+imported = time.perf_counter()
+{code}
+print(imported - start, time.perf_counter() - imported)
+'''
+
+# first call of each kind of solver, with one step at one temperature
+COMPILE_CODE = {
+    'solver_factory': "solver = asd.solver_factory({integrator!r}, {approximation!r}, {order}, {spin}, {a_1}, {a_2}, "
+                      "{alpha}, {time_step})\n"
+                      "asd.compute_temperature_dependence(solver, np.ones(1), {approximation!r}, {spin}, {time_step}, "
+                      "0.0, {time_step}, 1, np.array([0.0, 0.0, 1.0]), 0)",
+    'solver_module': "solvers = asd.solver_module({approximation!r}, {order}, {spin})\n"
+                     "solvers.compute_temperature_dependence(np.ones(1), {approximation!r}, {spin}, {time_step}, 0.0, "
+                     "{time_step}, 1, np.array([0.0, 0.0, 1.0]), 0, "
+                     "asd.solver_arguments({integrator!r}, {spin}, {a_1}, {a_2}, {alpha}, {time_step}))",
+}
+
+DERIVATION_TIMER = '''import time
+import symbolic
+start = time.perf_counter()
+field = {code}
+print(time.perf_counter() - start)
+'''
+
+
+def record(benchmark, value, unit, **labels):
+    """Returns the result of one benchmark as a dictionary of its name, labels, value and unit"""
+    return {'benchmark': benchmark, **labels, 'value': value, 'unit': unit}
+
+
+def best_time(function, repeat):
+    """Returns the shortest of repeat wall times of function() in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_python(code, repeat, environment=None):
+    """Returns the median over repeat fresh interpreters of each number printed on the last line by code"""
+    outputs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                env=environment, cwd=os.path.dirname(os.path.abspath(__file__)))
+        outputs.append([float(value) for value in result.stdout.splitlines()[-1].split()])
+    return [statistics.median(values) for values in zip(*outputs)]
+
+
+def step_throughput(spins, num_steps, repeat):
+    """Returns the records of the steps per second of the solvers of solver_factory using
+    spin_advance_symplectic and spin_advance_runge_kutta_4, and of the compiled solver modules
+    with each integrator, for each approximation and spin. Compilation is excluded by a first call."""
+    production_time = num_steps * TIME_STEP
+    records = []
+    for quantum_spin in spins:
+        for approximation, order in APPROXIMATIONS.items():
+            for integrator in STEP_INTEGRATORS:
+                solver = asd.solver_factory(integrator, approximation, order, quantum_spin, A_1, A_2, ALPHA, TIME_STEP)
+
+                def run(time=production_time):
+                    asd.compute_temperature_dependence(solver, np.array([TEMPERATURE]), approximation, quantum_spin,
+                                                       TIME_STEP, 0.0, time, 1, SPIN_INITIAL, 0)
+
+                run(TIME_STEP)
+                records.append(record('steps', num_steps / best_time(run, repeat), 'steps/s', solver='solver_factory',
+                                      integrator=integrator, approximation=approximation, spin=quantum_spin))
+
+            solvers = asd.solver_module(approximation, order, quantum_spin)
+            for integrator in asd.INTEGRATORS:
+                solver_args = asd.solver_arguments(integrator, quantum_spin, A_1, A_2, ALPHA, TIME_STEP)
+
+                def run(time=production_time):
+                    solvers.compute_temperature_dependence(np.array([TEMPERATURE]), approximation, quantum_spin,
+                                                           TIME_STEP, 0.0, time, 1, SPIN_INITIAL, 0, solver_args)
+
+                run(TIME_STEP)
+                records.append(record('steps', num_steps / best_time(run, repeat), 'steps/s', solver='solver_module',
+                                      integrator=integrator, approximation=approximation, spin=quantum_spin))
+    return records
+
+
+def cache_environment(cache_dir):
+    """Returns the environment of a fresh interpreter with both the solver modules and the numba
+    cache of every compiled function in cache_dir"""
+    return {**os.environ, 'PISD_CACHE_DIR': cache_dir, 'NUMBA_CACHE_DIR': cache_dir}
+
+
+def compile_times(spins, repeat):
+    """Returns the records of the import and compile times of the first call of the solvers of
+    solver_factory and solver_module in fresh interpreters, so that no lru_cache or imported module
+    is shared between repeats. Cold, every repeat has a new empty cache directory; warm, they share
+    one filled by an untimed run first."""
+    records = []
+    for quantum_spin in spins:
+        for approximation, order in APPROXIMATIONS.items():
+            for solver, code in COMPILE_CODE.items():
+                code = COMPILE_TIMER.format(code=code.format(
+                    integrator='symplectic', approximation=approximation, order=order, spin=float(quantum_spin),
+                    a_1=A_1, a_2=A_2, alpha=ALPHA, time_step=TIME_STEP))
+
+                cold_times = []
+                for _ in range(repeat):
+                    with tempfile.TemporaryDirectory() as cache_dir:
+                        cold_times.append(run_python(code, 1, cache_environment(cache_dir)))
+
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    run_python(code, 1, cache_environment(cache_dir))
+                    warm_times = [run_python(code, 1, cache_environment(cache_dir)) for _ in range(repeat)]
+
+                for cache, times in (('cold', cold_times), ('warm', warm_times)):
+                    import_time, compile_time = (statistics.median(values) for values in zip(*times))
+                    labels = dict(solver=solver, cache=cache, approximation=approximation, spin=quantum_spin)
+                    records.append(record('import', import_time, 's', **labels))
+                    records.append(record('compile', compile_time, 's', **labels))
+    return records
+
+
+def derivation_times(two_s_values, orders, repeat):
+    """Returns the records of the time sympy takes to derive the field of each (2s, order), order
+    None being the exact field, with symbolic.generate_field_function(_exact) in fresh interpreters
+    so that the sympy cache of one derivation does not speed up the next"""
+    records = []
+    for two_s in two_s_values:
+        for order in list(orders) + [None]:
+            if order is None:
+                code = f'symbolic.generate_field_function_exact({two_s / 2})'
+            else:
+                code = f'symbolic.generate_field_function({two_s / 2}, {order})'
+            derivation_time, = run_python(DERIVATION_TIMER.format(code=code), repeat)
+            records.append(record('derivation', derivation_time, 's', two_s=two_s, order=order))
+    return records
+
+
+def analytic_throughput(spins, num_temperatures, repeat):
+    """Returns the records of the temperatures per second at which analytic.quantum_state_sz is evaluated
+    on an array of num_temperatures"""
+    temperatures = np.linspace(0.07, 5, num_temperatures)
+    records = []
+    for quantum_spin in spins:
+        elapsed = best_time(lambda: analytic.quantum_state_sz(quantum_spin, temperatures, 0.0, A_1, A_2), repeat)
+        records.append(record('quantum_state_sz', num_temperatures / elapsed, 'temperatures/s', spin=quantum_spin))
+    return records
+
+
+def git_commit():
+    """Returns the commit of the working tree, or None outside a git repository"""
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def machine():
+    """Returns the description of the machine, the records of which are compared with each other"""
+    return {'host': platform.node(), 'processor': platform.processor() or platform.machine(),
+            'cpu_count': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'numba': numba.__version__}
+
+
+def labels_of(result):
+    """Returns the labels identifying a result across runs"""
+    return tuple(sorted((name, value) for name, value in result.items() if name != 'value'))
+
+
+def regressions(results, history, threshold, num_compared):
+    """Returns the (result, median) of the results worse than the median of the num_compared latest
+    records of history by more than the fraction threshold, lower being worse for the rates"""
+    previous = {}
+    for entry in history[-num_compared:]:
+        for result in entry['results']:
+            previous.setdefault(labels_of(result), []).append(result['value'])
+
+    slower = []
+    for result in results:
+        values = previous.get(labels_of(result))
+        if not values:
+            continue
+        median = statistics.median(values)
+        if result['unit'].endswith('/s'):
+            worse = result['value'] < (1 - threshold) * median
+        else:
+            worse = result['value'] > (1 + threshold) * median
+        if worse:
+            slower.append((result, median))
+    return slower
+
+
+def load_history(file_name, machine_description):
+    """Returns the records of the history file made on the machine, oldest first"""
+    if not os.path.exists(file_name):
+        return []
+    with open(file_name) as history_file:
+        entries = [json.loads(line) for line in history_file if line.strip()]
+    return [entry for entry in entries if entry['machine'] == machine_description]
+
+
+def describe(result):
+    """Returns the one line description of a result"""
+    labels = ' '.join(f'{name}={value}' for name, value in result.items()
+                      if name not in ('benchmark', 'value', 'unit'))
+    return f'{result["benchmark"]:<16} {labels:<80} {result["value"]:>12.4g} {result["unit"]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the integration steps, compilation, field derivation '
+                                                 'and exact solution, and compare with earlier runs.')
+
+    parser.add_argument('--benchmarks',
+                        nargs='+',
+                        choices=['steps', 'compile', 'derivation', 'analytic'],
+                        default=['steps', 'compile', 'derivation', 'analytic'],
+                        help='Benchmarks to run')
+
+    parser.add_argument('--spin',
+                        type=float,
+                        nargs='+',
+                        default=[1.0],
+                        help='Quantum spin values of the steps, compile and analytic benchmarks')
+
+    parser.add_argument('--two-s',
+                        type=int,
+                        nargs='+',
+                        default=[1, 2, 3, 4],
+                        help='Values of 2s of the fields derived by sympy')
+
+    parser.add_argument('--orders',
+                        type=int,
+                        nargs='+',
+                        default=[2, 3],
+                        help='Orders of the fields derived by sympy, the exact field is always included')
+
+    parser.add_argument('--steps',
+                        type=int,
+                        default=200000,
+                        help='Number of steps of each step throughput measurement')
+
+    parser.add_argument('--temperatures',
+                        type=int,
+                        default=100000,
+                        help='Number of temperatures of each quantum_state_sz measurement')
+
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=3,
+                        help='Number of times each measurement is repeated, the fastest in process and the median '
+                             'of fresh interpreters is reported')
+
+    parser.add_argument('--history',
+                        default=HISTORY_FILE,
+                        help='JSON lines file the results are appended to and compared with')
+
+    parser.add_argument('--compare',
+                        type=int,
+                        default=5,
+                        help='Number of the latest runs on this machine whose median each result is compared with')
+
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=0.2,
+                        help='Fraction by which a result has to be worse than that median to be a regression')
+
+    parser.add_argument('--fail-on-regression',
+                        action='store_true',
+                        help='Exit with status 1 if there is a regression')
+
+    args = parser.parse_args()
+
+    results = []
+    if 'steps' in args.benchmarks:
+        results += step_throughput(args.spin, args.steps, args.repeat)
+    if 'compile' in args.benchmarks:
+        results += compile_times(args.spin, args.repeat)
+    if 'derivation' in args.benchmarks:
+        results += derivation_times(args.two_s, args.orders, args.repeat)
+    if 'analytic' in args.benchmarks:
+        results += analytic_throughput(args.spin, args.temperatures, args.repeat)
+
+    for result in results:
+        print(describe(result))
+
+    machine_description = machine()
+    slower = regressions(results, load_history(args.history, machine_description), args.threshold, args.compare)
+    for result, median in slower:
+        print(f'regression: {describe(result)} (median of earlier runs {median:.4g})')
+
+    entry = {'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+             'commit': git_commit(), 'code_version': asd.code_version(), 'machine': machine_description,
+             'arguments': sys.argv[1:], 'results': results}
+    with open(args.history, 'a') as history_file:
+        history_file.write(json.dumps(entry) + '\n')
+
+    if slower and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
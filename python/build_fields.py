@@ -0,0 +1,56 @@
+import time
+import argparse
+import symbolic
+
+# Writes fields.py, the library of effective field expressions used by asd.solver_module, so that
+# runs with any of the tabulated (2s, order) never need sympy.
+parser = argparse.ArgumentParser(description='Derive the effective field expressions once with sympy.')
+
+parser.add_argument('--two-s',
+                    type=int,
+                    nargs='+',
+                    default=[1, 2, 3, 4],
+                    help='Values of twice the quantum spin to derive the fields for')
+
+parser.add_argument('--orders',
+                    type=int,
+                    nargs='+',
+                    default=[2, 3],
+                    help='Orders of the quantum-approximation fields (2 is the classical limit), '
+                         'the quantum-exact field is always derived')
+
+parser.add_argument('--output',
+                    default='fields.py',
+                    help='File to write the library to')
+
+args = parser.parse_args()
+
+HEADER = '''"""Effective field expressions derived with sympy by build_fields.py, do not edit.
+
+FIELD_SOURCES maps (two_s, order) to the numpy source of the z-component of the effective field in
+terms of beta, A_2, A_1, n_z, g, mu_B, with order None for the quantum-exact field.
+"""
+
+FIELD_SOURCES = {
+'''
+
+
+def main():
+    entries = []
+    for two_s in args.two_s:
+        for order in args.orders + [None]:
+            start = time.process_time()
+            if order is None:
+                expression = symbolic.eff_field_formal_exact(two_s)
+            else:
+                expression = symbolic.eff_field_formal(two_s, order)
+            entries.append(f'    ({two_s}, {order}):\n'
+                           f'        {symbolic.field_function_source(expression)!r},\n')
+            print(f'2s: {two_s} order: {order} ({time.process_time() - start:.3f} s)')
+
+    with open(args.output, 'w') as library_file:
+        library_file.write(HEADER + ''.join(entries) + '}\n')
+
+
+if __name__ == "__main__":
+    main()
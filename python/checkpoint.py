@@ -0,0 +1,62 @@
+import os
+import numpy as np
+import asd
+
+CHECKPOINT_STEPS = 20000  # steps between checkpoints, 1 ns at the default time step
+
+
+def save_checkpoint(file_name, **state):
+    """Saves the arrays of state to the npz file, writing then renaming so that a run killed while
+    saving leaves the previous checkpoint intact"""
+    temporary_file_name = f'{file_name}.{os.getpid()}.tmp.npz'
+    np.savez(temporary_file_name, **state)
+    os.replace(temporary_file_name, file_name)
+
+
+def load_checkpoint(file_name):
+    """Returns the dictionary of arrays saved by save_checkpoint"""
+    with np.load(file_name) as checkpoint:
+        return {name: checkpoint[name] for name in checkpoint.files}
+
+
+def compute_temperature_dependence_checkpointed(solvers, temperatures, low_high_t, quantum_spin, time_step,
+                                                equilibration_time, production_time, num_realisation,
+                                                spin_initial, seed, solver_args, checkpoint_file,
+                                                arguments=(), checkpoint_steps=CHECKPOINT_STEPS):
+    """Returns the expectation values of compute_temperature_dependence_ensemble, for the solvers of
+    asd.solver_module, saving the state of the run to checkpoint_file every checkpoint_steps steps.
+
+    If checkpoint_file exists the run continues from it, giving exactly the result of an
+    uninterrupted run: the state is the spins, the time averages accumulated so far and the step,
+    which is also the state of the counter-based random number streams. arguments, e.g. the command
+    line of the run, are saved with it so that the run can be restarted from the file alone.
+    """
+    num_eq_steps = int(equilibration_time / time_step)
+    num_steps = num_eq_steps + int(production_time / time_step)
+
+    spins, ensemble_temperatures, temperature_indices, realisations = asd.initial_ensemble(
+        temperatures, num_realisation, spin_initial)
+    spin_z = np.zeros(spins.shape[0])
+    step = 0
+
+    run = {'arguments': np.array(arguments, dtype=str), 'code_version': np.array(asd.code_version()),
+           'seed': np.array(seed), 'temperatures': temperatures, 'num_realisation': np.array(num_realisation),
+           'num_eq_steps': np.array(num_eq_steps), 'num_steps': np.array(num_steps),
+           'solver_args': np.array(solver_args)}
+
+    if os.path.exists(checkpoint_file):
+        checkpoint = load_checkpoint(checkpoint_file)
+        for name, value in run.items():
+            if name != 'arguments' and not np.array_equal(checkpoint[name], value):
+                raise RuntimeError(f'Checkpoint {checkpoint_file} is of a different run: {name} differs')
+        spins, spin_z, step = checkpoint['spins'], checkpoint['spin_z'], int(checkpoint['step'])
+
+    while step < num_steps:
+        last_step = min(step + checkpoint_steps, num_steps)
+        solvers.advance_ensemble(spins, ensemble_temperatures, step, last_step, num_eq_steps, seed,
+                                 temperature_indices, realisations, spin_z, solver_args)
+        step = last_step
+        save_checkpoint(checkpoint_file, spins=spins, spin_z=spin_z, step=np.array(step), **run)
+
+    return asd.ensemble_average(spin_z / (num_steps - num_eq_steps), temperatures.shape[0], num_realisation,
+                                asd.renormalisation_factor(low_high_t, quantum_spin))
@@ -0,0 +1,32 @@
+"""Effective field expressions derived with sympy by build_fields.py, do not edit.
+
+FIELD_SOURCES maps (two_s, order) to the numpy source of the z-component of the effective field in
+terms of beta, A_2, A_1, n_z, g, mu_B, with order None for the quantum-exact field.
+"""
+
+FIELD_SOURCES = {
+    (1, 2):
+        'A_1/(g*mu_B)',
+    (1, 3):
+        '(1/2)*A_1*(-A_1*beta*n_z + 2)/(g*mu_B)',
+    (1, None):
+        '(2*numpy.exp(A_1*beta) - 2)/(beta*g*mu_B*(-n_z + (n_z + 1)*numpy.exp(A_1*beta) + 1))',
+    (2, 2):
+        '(A_1 + A_2*n_z)/(g*mu_B)',
+    (2, 3):
+        '(1/2)*(-A_1**2*beta*n_z - 3*A_1*A_2*beta*n_z**2 + A_1*A_2*beta + 2*A_1 - A_2**2*beta*n_z**3 + 2*A_2*n_z)/(g*mu_B)',
+    (2, None):
+        '2*((1 - n_z)*numpy.exp(A_1*beta) + (n_z - 1)*numpy.exp(A_2*beta) - (n_z + 1)*numpy.exp(A_1*beta) + (n_z + 1)*numpy.exp(beta*(2*A_1 + A_2)))/(beta*g*mu_B*((n_z - 1)**2*numpy.exp(A_2*beta) - 2*(n_z - 1)*(n_z + 1)*numpy.exp(A_1*beta) + (n_z + 1)**2*numpy.exp(beta*(2*A_1 + A_2))))',
+    (3, 2):
+        '(A_1 + 2*A_2*n_z)/(g*mu_B)',
+    (3, 3):
+        '(-1/2*A_1**2*beta*n_z - 3*A_1*A_2*beta*n_z**2 + A_1*A_2*beta + A_1 - 3*A_2**2*beta*n_z**3 + A_2**2*beta*n_z + 2*A_2*n_z)/(g*mu_B)',
+    (3, None):
+        '2*(-(n_z - 1)**2*numpy.exp(A_1*beta) + (n_z - 1)**2*numpy.exp(2*A_2*beta) + 2*(n_z - 1)*(n_z + 1)*numpy.exp(2*A_1*beta) - 2*(n_z - 1)*(n_z + 1)*numpy.exp(A_1*beta) + (n_z + 1)**2*numpy.exp(2*A_1*beta) - (n_z + 1)**2*numpy.exp(beta*(3*A_1 + 2*A_2)))/(beta*g*mu_B*((n_z - 1)**3*numpy.exp(2*A_2*beta) - 3*(n_z - 1)**2*(n_z + 1)*numpy.exp(A_1*beta) + 3*(n_z - 1)*(n_z + 1)**2*numpy.exp(2*A_1*beta) - (n_z + 1)**3*numpy.exp(beta*(3*A_1 + 2*A_2))))',
+    (4, 2):
+        '(A_1 + 3*A_2*n_z)/(g*mu_B)',
+    (4, 3):
+        '(1/2)*(-A_1**2*beta*n_z - 9*A_1*A_2*beta*n_z**2 + 3*A_1*A_2*beta + 2*A_1 - 15*A_2**2*beta*n_z**3 + 6*A_2**2*beta*n_z + 6*A_2*n_z)/(g*mu_B)',
+    (4, None):
+        '2*(3*(1 - n_z)*(n_z + 1)**2*numpy.exp(beta*(3*A_1 + A_2)) + (n_z - 1)**3*numpy.exp(4*A_2*beta) - (n_z - 1)**3*numpy.exp(beta*(A_1 + A_2)) + 3*(n_z - 1)**2*(n_z + 1)*numpy.exp(2*A_1*beta) - 3*(n_z - 1)**2*(n_z + 1)*numpy.exp(beta*(A_1 + A_2)) + 3*(n_z - 1)*(n_z + 1)**2*numpy.exp(2*A_1*beta) + (n_z + 1)**3*numpy.exp(4*beta*(A_1 + A_2)) - (n_z + 1)**3*numpy.exp(beta*(3*A_1 + A_2)))/(beta*g*mu_B*((n_z - 1)**4*numpy.exp(4*A_2*beta) - 4*(n_z - 1)**3*(n_z + 1)*numpy.exp(beta*(A_1 + A_2)) + 6*(n_z - 1)**2*(n_z + 1)**2*numpy.exp(2*A_1*beta) - 4*(n_z - 1)*(n_z + 1)**3*numpy.exp(beta*(3*A_1 + A_2)) + (n_z + 1)**4*numpy.exp(4*beta*(A_1 + A_2))))',
+}
@@ -1,5 +1,6 @@
 import asd
 import os
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 import time
@@ -7,15 +8,31 @@ from fractions import Fraction
 
 # local imports
 import analytic
+import result_cache
+import run_settings
+import run_report
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Calculate and plot the figure, reading the spin dynamics from its '
+                                                 'data in figures/ where it exists.')
+
+    parser.add_argument('--force',
+                        action='store_true',
+                        help='Recompute the spin dynamics, from the result cache where possible, and overwrite their '
+                             'data in figures/')
+
+    parser.add_argument('--report',
+                        default=None,
+                        help='Write a JSON report of the run to this file (see run_report.py)')
+
+    args = parser.parse_args()
+
     plt.style.use('resources/aps-paper.mplstyle')
+    report = run_report.new_report(script=os.path.basename(__file__)) if args.report is not None else None
     data_path = 'figures/figure3_data'
     os.makedirs(data_path, exist_ok=True)
 
-    integrator = 'symplectic'
-
     # Simulation conditions
     alpha = 0.5  # Gilbert Damping parameter.
     s0 = np.array([1 / np.sqrt(3), 1.0 / np.sqrt(3), -1.0 / np.sqrt(3)])  # Initial spin
@@ -28,25 +45,24 @@ def main():
 
     temperatures = np.linspace(0.02, 10, 200)
 
-    # Equilibration time, final time and time step
-    num_realisation = 20
-    equilibration_time = 5  # Equilibration time ns
-    production_time = 15  # Final time ns
-    time_step = 0.00005  # Time step ns, "linspace" so needs to turn num into int
+    # Integrator, time step, equilibration and final time and realisations of the spin, see run_settings.py
+    settings = run_settings.RUN_SETTINGS.get(int(2 * quantum_spin), run_settings.RUN_SETTINGS[None])
+    integrator = settings['integrator']
+    num_realisation = settings['num_realisation']
+    equilibration_time = settings['equilibration_time']  # Equilibration time ns
+    production_time = settings['production_time']  # Final time ns
+    time_step = settings['time_step']  # Time step ns
 
     a_0 = stress
     a_1 = asd.g_factor * asd.muB * field
     a_2 = K - a_0
 
     # --- calculate and save exact quantum solution ---
+    quantum_solution = analytic.quantum_state_sz(quantum_spin, temperatures, a_0, a_1, a_2)
     ed_solution_file = f"{data_path}/analytical_quantum_state_solution_s{quantum_spin:.1f}_K{K_factor}.tsv"
-    if os.path.exists(ed_solution_file):
-        temperatures, quantum_solution = np.loadtxt(ed_solution_file, unpack=True)
-    else:
-        quantum_solution = analytic.quantum_state_sz(quantum_spin, temperatures, a_0, a_1, a_2)
-        np.savetxt(f"{data_path}/analytical_quantum_state_solution_s{quantum_spin:.1f}_K{K_factor}.tsv",
-               np.column_stack((temperatures, quantum_solution)), fmt='%.8e',
-               header='temperature_kelvin sz-expectation_hbar')
+    if args.force or not os.path.exists(ed_solution_file):
+        np.savetxt(ed_solution_file, np.column_stack((temperatures, quantum_solution)), fmt='%.8e',
+                   header='temperature_kelvin sz-expectation_hbar')
 
     # --- calculate quantum result from exact q-ASD and classical limit to compare to ---
 
@@ -57,16 +73,10 @@ def main():
 
     asd_data_file_quantum_exact = f'{data_path}/qsd_quantum-exact_solution_s{quantum_spin:.1f}_K{K_factor}.tsv'
 
-    if os.path.exists(asd_data_file_quantum_exact):
-        temperatures, sz_quantum_exact = np.loadtxt(asd_data_file_quantum_exact, unpack=True)
-    else:
-        solver_quantum_exact = asd.solver_factory(integrator, 'quantum-exact', order, quantum_spin, a_1, a_2, alpha, time_step)
-        sz_quantum_exact = asd.compute_temperature_dependence(solver_quantum_exact, temperatures, 'quantum-exact', quantum_spin, time_step,
-                                                equilibration_time, production_time, num_realisation, s0)
-
-        np.savetxt(f"{data_path}/qsd_quantum-exact_solution_s{quantum_spin:.1f}_K{K_factor}.tsv",
-                   np.column_stack((temperatures, sz_quantum_exact)), fmt='%.8e',
-                   header='temperature_kelvin sz-expectation_hbar')
+    # the checked-in data is read back, points missing from it are taken from the result cache
+    sz_quantum_exact = result_cache.load_or_compute_temperature_dependence(asd_data_file_quantum_exact, args.force, temperatures, 'quantum-exact', order, quantum_spin, integrator,
+                                                                           a_1, a_2, alpha, time_step, equilibration_time,
+                                                                           production_time, num_realisation, s0, report=report)
 
     # asd_data_file_classical = f'{data_path}/qsd_classical-limit_solution_s{quantum_spin:.1f}.tsv'
     # if os.path.exists(asd_data_file_classical):
@@ -91,7 +101,10 @@ def main():
     plt.text(6, 0.6, rf"K = {K_factor}$g\mu_B\mu_0H_z$")
 
     # plt.show()
-    plt.savefig('figures/figure3_a.pdf', transparent=True)
+    with run_report.phase(report, 'output'):
+        plt.savefig('figures/figure3_a.pdf', transparent=True)
+    if report is not None:
+        run_report.write_report(report, args.report)
 
 
 if __name__ == "__main__":
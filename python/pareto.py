@@ -0,0 +1,298 @@
+import os
+import time
+import argparse
+import itertools
+import numpy as np
+import asd
+import analytic
+import rng
+import run_settings
+
+# Accuracy against cost of the settings of the spin dynamics: each combination of integrator, time
+# step, production time and number of realisations is run for each approximation and scored by
+# its wall time and its error. The Pareto front is the settings no other setting beats on both, and
+# the recommended setting of a spin is the cheapest one as accurate as the current run_settings.
+
+# order of each approximation, as for solver_module
+APPROXIMATIONS = {'classical-limit': 2, 'quantum-approximation': 3, 'quantum-exact': None}
+
+ENGINES = {'scalar': 'compute_temperature_dependence',
+           'ensemble': 'compute_temperature_dependence_ensemble',
+           'parallel': 'compute_temperature_dependence_parallel'}
+
+# the run_settings module imported by pisd.py and the figure scripts, whatever the working directory
+RUN_SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_settings.py')
+
+COLUMNS = ('spin', 'approximation', 'integrator', 'time_step', 'production_time', 'num_realisation',
+           'wall_seconds', 'error', 'numerical_error', 'pareto')
+
+SETTINGS_HEADER = '''"""Default run settings of the spin dynamics, written by pareto.py --write-settings.
+
+RUN_SETTINGS maps 2s to the integrator, time_step (ns), equilibration_time (ns), production_time (ns)
+and num_realisation used by the figure scripts, with 2s None for any other spin. pisd.py takes all
+but num_realisation.
+"""
+
+RUN_SETTINGS = {
+'''
+
+
+def setting_grid(integrators, time_steps, production_times, num_realisations):
+    """Returns the list of (integrator, time_step, production_time, num_realisation) settings of the
+    Cartesian product of the values"""
+    return list(itertools.product(integrators, time_steps, production_times, num_realisations))
+
+
+def run_setting(compute, approximation, quantum_spin, setting, temperatures, a_1, a_2, alpha, equilibration_time,
+                spin_initial, seeds):
+    """Returns the (len(seeds), len(temperatures)) array of the expectation values of the z-component
+    of the spin computed by compute with the setting for each seed, and the mean wall time of a run in
+    seconds, compilation excluded"""
+    integrator, time_step, production_time, num_realisation = setting
+    solver_args = asd.solver_arguments(integrator, quantum_spin, a_1, a_2, alpha, time_step)
+
+    # one step first, so that a compilation for new argument types is not timed
+    compute(temperatures[:1], approximation, quantum_spin, time_step, 0.0, time_step, 1, spin_initial, 0,
+            solver_args)
+
+    sz = np.empty((len(seeds), len(temperatures)))
+    start = time.perf_counter()
+    for i, seed in enumerate(seeds):
+        sz[i] = compute(temperatures, approximation, quantum_spin, time_step, equilibration_time, production_time,
+                        num_realisation, spin_initial, seed, solver_args)
+    return sz, (time.perf_counter() - start) / len(seeds)
+
+
+def rms_error(sz, reference):
+    """Returns the root mean square difference of the (seeds, temperatures) sz from the reference at
+    the temperatures where the reference is finite, infinite if any of sz there is not"""
+    finite = np.isfinite(reference)
+    error = np.sqrt(np.mean((sz[:, finite] - reference[finite])**2))
+    return error if np.isfinite(error) else np.inf
+
+
+def pareto_front(costs, errors):
+    """Returns the indices, cheapest first, of the points not beaten by another in both cost and error"""
+    front = []
+    lowest_error = np.inf
+    for i in np.lexsort((errors, costs)):
+        if errors[i] < lowest_error:
+            front.append(i)
+            lowest_error = errors[i]
+    return front
+
+
+def recommend(costs, errors, target_error):
+    """Returns the index of the cheapest point with an error of at most target_error, None if there is none"""
+    candidates = np.flatnonzero(np.asarray(errors) <= target_error)
+    if candidates.shape[0] == 0:
+        return None
+    return candidates[np.argmin(np.asarray(costs)[candidates])]
+
+
+def benchmark_spin(quantum_spin, approximations, settings, temperatures, field, anisotropy, stress, alpha,
+                   equilibration_time, spin_initial, seeds, engine):
+    """Returns the dictionary from approximation to the (costs, errors, numerical_errors) arrays of the
+    settings, the errors being those against analytic.quantum_state_sz and the numerical errors those
+    against the quadrature engine for the same approximation, i.e. of the dynamics alone"""
+    a_0 = stress
+    a_1 = asd.g_factor * asd.muB * field
+    a_2 = anisotropy - a_0
+    exact = analytic.quantum_state_sz(quantum_spin, temperatures, a_0, a_1, a_2)
+
+    scores = {}
+    for approximation in approximations:
+        solvers = asd.solver_module(approximation, APPROXIMATIONS[approximation], quantum_spin)
+        compute = getattr(solvers, ENGINES[engine])
+        quadrature = solvers.compute_temperature_dependence_quadrature(temperatures, approximation, quantum_spin,
+                                                                      a_1, a_2)
+
+        # the approximations beyond the classical limit are renormalised as in the figures
+        normalisation = 1.0 if APPROXIMATIONS[approximation] == 2 else (quantum_spin + 1) / quantum_spin
+
+        costs, errors, numerical_errors = (np.empty(len(settings)) for _ in range(3))
+        for i, setting in enumerate(settings):
+            sz, costs[i] = run_setting(compute, approximation, quantum_spin, setting, temperatures, a_1, a_2, alpha,
+                                       equilibration_time, spin_initial, seeds)
+            errors[i] = rms_error(normalisation * sz, exact)
+            numerical_errors[i] = rms_error(sz, quadrature)
+            print(f's: {quantum_spin} {approximation} {setting}: {costs[i]:.2f} s, error {errors[i]:.4f}, '
+                  f'numerical error {numerical_errors[i]:.4f}')
+        scores[approximation] = costs, errors, numerical_errors
+    return scores
+
+
+def write_settings(file_name, settings):
+    """Writes the run_settings module for the dictionary from 2s to settings"""
+    entries = [f'    {two_s!r}: {settings[two_s]!r},\n'
+               for two_s in sorted(settings, key=lambda two_s: (two_s is None, two_s))]
+    with open(file_name, 'w') as settings_file:
+        settings_file.write(SETTINGS_HEADER + ''.join(entries) + '}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score settings of the spin dynamics by accuracy and cost, and '
+                                                 'recommend the cheapest as accurate as the current defaults.')
+
+    parser.add_argument('--approximation',
+                        nargs='+',
+                        choices=list(APPROXIMATIONS),
+                        default=list(APPROXIMATIONS),
+                        help='Approximation schemes to score, a recommended setting has to do for all of them')
+
+    parser.add_argument('--spin',
+                        type=float,
+                        nargs='+',
+                        default=[0.5, 1.0, 1.5, 2.0],
+                        help='Quantum spin values to recommend settings for')
+
+    parser.add_argument('--field',
+                        type=float,
+                        default=1.0,
+                        help='Z-component of magnetic field (in Tesla)')
+
+    parser.add_argument('--anisotropy',
+                        type=float,
+                        default=0.0,
+                        help='Uniaxial anisotropy energy (K in Joules)')
+
+    parser.add_argument('--stress',
+                        type=float,
+                        default=0.0,
+                        help='Product of lambda and sigma (in Joules)')
+
+    parser.add_argument('--temperatures',
+                        type=float,
+                        nargs=3,
+                        default=[0.1, 10, 10],
+                        metavar=('START', 'STOP', 'NUM'),
+                        help='Temperatures in Kelvin, as for numpy.linspace')
+
+    parser.add_argument('--integrators',
+                        nargs='+',
+                        choices=list(asd.INTEGRATORS),
+                        default=list(asd.INTEGRATORS),
+                        help='Integrators of the grid of settings')
+
+    parser.add_argument('--time-steps',
+                        type=float,
+                        nargs='+',
+                        default=[0.00005, 0.0001, 0.0002],
+                        help='Time steps of the grid of settings (in ns)')
+
+    parser.add_argument('--production-times',
+                        type=float,
+                        nargs='+',
+                        default=[1.0, 3.0, 15.0],
+                        help='Production times of the grid of settings (in ns)')
+
+    parser.add_argument('--realisations',
+                        type=int,
+                        nargs='+',
+                        default=[5, 10, 20],
+                        help='Numbers of realisations of the grid of settings')
+
+    parser.add_argument('--seeds',
+                        type=int,
+                        default=2,
+                        help='Number of seeds each setting is run with, the errors are over all of them')
+
+    parser.add_argument('--seed',
+                        type=int,
+                        default=None,
+                        help='Seed the seeds of the runs are derived from (random if not given)')
+
+    parser.add_argument('--engine',
+                        choices=list(ENGINES),
+                        default='ensemble',
+                        help='Engine used for every run, timed by wall time so that the parallel engine gains from all cores')
+
+    parser.add_argument('--target-error',
+                        type=float,
+                        default=None,
+                        help='Largest numerical error of a recommended setting (the numerical error of the current '
+                             'run_settings of the spin if not given)')
+
+    parser.add_argument('--output',
+                        default='pareto.tsv',
+                        help='File the scores of every setting are written to')
+
+    parser.add_argument('--write-settings',
+                        nargs='?',
+                        const=RUN_SETTINGS_FILE,
+                        default=None,
+                        metavar='FILE',
+                        help='Write the recommended settings of the spins, and the current ones of the others, to '
+                             'this run_settings module (python/run_settings.py, the one the scripts import, if no '
+                             'file is given)')
+
+    args = parser.parse_args()
+
+    alpha = 0.5  # Gilbert Damping parameter.
+    s0 = np.array([1 / np.sqrt(3), 1.0 / np.sqrt(3), -1.0 / np.sqrt(3)])  # Initial spin
+
+    start, stop, num = args.temperatures
+    temperatures = np.linspace(start, stop, int(num))
+    seed = args.seed if args.seed is not None else np.random.randint(2**62)
+    seeds = [rng.substream_seed(seed, i) for i in range(args.seeds)]
+
+    grid = setting_grid(args.integrators, args.time_steps, args.production_times, args.realisations)
+    recommended_settings = dict(run_settings.RUN_SETTINGS)
+    rows = []
+    for quantum_spin in args.spin:
+        two_s = int(2 * quantum_spin)
+        current = run_settings.RUN_SETTINGS.get(two_s, run_settings.RUN_SETTINGS[None])
+        current_setting = (current['integrator'], current['time_step'], current['production_time'],
+                           current['num_realisation'])
+        settings = grid + [current_setting] if current_setting not in grid else grid
+
+        scores = benchmark_spin(quantum_spin, args.approximation, settings, temperatures, args.field,
+                                args.anisotropy, args.stress, alpha, current['equilibration_time'], s0, seeds,
+                                args.engine)
+
+        for approximation, (costs, errors, numerical_errors) in scores.items():
+            front = set(pareto_front(costs, numerical_errors))
+            rows += [(quantum_spin, approximation, *settings[i], costs[i], errors[i], numerical_errors[i], i in front)
+                     for i in range(len(settings))]
+            print(f'Pareto front for s = {quantum_spin} {approximation}:')
+            for i in sorted(front, key=lambda i: costs[i]):
+                print(f'    {settings[i]}: {costs[i]:.2f} s, numerical error {numerical_errors[i]:.4f}')
+
+        # a setting has to do for every approximation, so it is scored by its worst error and total cost
+        total_costs = np.sum([costs for costs, _, _ in scores.values()], axis=0)
+        worst_errors = np.max([numerical_errors for _, _, numerical_errors in scores.values()], axis=0)
+        target_error = args.target_error if args.target_error is not None \
+            else worst_errors[settings.index(current_setting)]
+        best = recommend(total_costs, worst_errors, target_error)
+        if best is None:
+            print(f'No setting for s = {quantum_spin} has a numerical error of at most {target_error:.4f}')
+            continue
+
+        integrator, time_step, production_time, num_realisation = settings[best]
+        recommended_settings[two_s] = {'integrator': integrator, 'time_step': time_step,
+                                       'equilibration_time': current['equilibration_time'],
+                                       'production_time': production_time, 'num_realisation': num_realisation}
+        print(f'Recommended for s = {quantum_spin}: {settings[best]}, {total_costs[best]:.2f} s and numerical '
+              f'error {worst_errors[best]:.4f} against {total_costs[settings.index(current_setting)]:.2f} s and '
+              f'{worst_errors[settings.index(current_setting)]:.4f} for the current setting')
+
+    header = f'field: {args.field}\n' \
+             f'anisotropy: {args.anisotropy}\n' \
+             f'stress: {args.stress}\n' \
+             f'temperatures: {args.temperatures}\n' \
+             f'engine: {args.engine}\n' \
+             f'seed: {seed}\n' \
+             f'seeds: {args.seeds}\n' \
+             f'\n' \
+             + ' '.join(COLUMNS)
+    np.savetxt(args.output, np.array(rows, dtype=object), fmt='%s', header=header)
+
+    if args.write_settings is not None:
+        write_settings(args.write_settings, recommended_settings)
+
+
+if __name__ == "__main__":
+    start = time.process_time()
+    main()
+    end = time.process_time()
+    print(f'runtime: {end - start:.3f} (s)')
@@ -1,15 +1,129 @@
+import sys
 import time
+import contextlib
 import argparse
 import numpy as np
-import asd
+import run_settings
 
 # Parsing parameters from command line
 parser = argparse.ArgumentParser(description='Simulation parameters from command line.')
 
 parser.add_argument('--integrator',
-                    choices=['runge-kutta-4', 'symplectic'],
-                    default='symplectic',
-                    help='Numerical integration method for solving the spin dynamics')
+                    choices=['runge-kutta-4', 'symplectic', 'heun', 'geometric-heun'],
+                    default=None,
+                    help='Numerical integration method for solving the spin dynamics (the one recommended for the '
+                         'spin in run_settings.py if not given)')
+
+parser.add_argument('--engine',
+                    choices=['scalar', 'ensemble', 'parallel', 'quadrature'],
+                    default=None,
+                    help='Advance one spin at a time (scalar, the default), all temperatures and realisations as one '
+                         'array (ensemble) or temperatures and realisations spread over all cores (parallel), or skip '
+                         'the dynamics and integrate their equilibrium distribution numerically (quadrature). Only '
+                         'for a plain run or, except quadrature, with --refine, the other modes run their own')
+
+parser.add_argument('--seed',
+                    type=int,
+                    default=None,
+                    help='Seed of the random number streams, making runs reproducible with any engine (random if not '
+                         'given)')
+
+parser.add_argument('--threads',
+                    type=int,
+                    default=None,
+                    help='Number of threads used by the parallel engine (all cores if not given)')
+
+parser.add_argument('--detect-equilibration',
+                    action='store_true',
+                    help='Switch to production as soon as the realisations are detected to have equilibrated, for '
+                         'at most four times the equilibration time, and flag the temperatures which ran out of it '
+                         'in an equilibration_capped column (one temperature at a time, alone or with --tolerance)')
+
+# the ways of running the dynamics other than the engines, at most one of which can be given
+modes = parser.add_mutually_exclusive_group()
+
+modes.add_argument('--tolerance',
+                   type=float,
+                   default=None,
+                   help='Stop each temperature as soon as the standard error of sz is below this, instead of always '
+                        'running the full production time of every realisation; the realisations advance together a '
+                        'block at a time, so the error covers all of them (one temperature at a time)')
+
+modes.add_argument('--anneal',
+                   type=float,
+                   default=None,
+                   metavar='REEQUILIBRATION_TIME',
+                   help='Walk the temperatures from the highest to the lowest, carrying each realisation from one '
+                        'to the next, and re-equilibrate for this time (in ns) instead of the full equilibration '
+                        'time, longer only where the carried spin is detected not to have equilibrated (one '
+                        'realisation at a time)')
+
+modes.add_argument('--replica-exchange',
+                   action='store_true',
+                   help='Swap the spins of neighbouring temperatures of each realisation every 0.01 ns with the '
+                        'Metropolis criterion on the effective Hamiltonian (parallel tempering), so that spins stuck '
+                        'in one well at low temperature are sampled correctly (all temperatures as one array)')
+
+modes.add_argument('--observables',
+                   action='store_true',
+                   help='Record <Sz>, <Sz^2>, the effective energy and the moment with their standard errors and '
+                        'variances in the same pass, and the susceptibility and heat capacity from their fluctuations '
+                        '(one temperature at a time)')
+
+modes.add_argument('--reweight',
+                   type=int,
+                   default=None,
+                   metavar='NUM_TEMPERATURES',
+                   help='Collect the histograms of Sz at the simulated temperatures and write <Sz> reweighted from '
+                        'them onto this many temperatures over the same range (one temperature at a time)')
+
+modes.add_argument('--refine',
+                   type=float,
+                   default=None,
+                   metavar='TOLERANCE',
+                   help='Start from 9 temperatures over the same range and add midpoints where linear interpolation '
+                        'of <Sz> may be off by more than this, judged by the quadrature curve and the disagreement '
+                        'with it, writing the irregular grid (with the scalar, ensemble or parallel engine)')
+
+modes.add_argument('--step-tolerance',
+                   type=float,
+                   default=None,
+                   help='Adapt the time step so that the local error of each step is close to this, starting from the '
+                        'default time step (heun and geometric-heun integrators only, one temperature at a time)')
+
+modes.add_argument('--checkpoint',
+                   default=None,
+                   help='Save the state of the run to this file every ns of simulated time, so that a run which is '
+                        'killed can be continued with --resume (all temperatures as one array, with the result of '
+                        'the ensemble engine)')
+
+modes.add_argument('--progress',
+                   default=None,
+                   metavar='PROGRESS_FILE',
+                   help='Run one temperature at a time in chunks of 1 ns at the default time step, writing the '
+                        'temperatures done, the estimated time left and the running <Sz> to this JSON file after '
+                        'each. Creating PROGRESS_FILE.cancel or pressing Ctrl-C stops the run after the current '
+                        'chunk and writes the temperatures finished (one temperature at a time, with the result of '
+                        'the ensemble engine)')
+
+parser.add_argument('--report',
+                    default=None,
+                    help='Also write a JSON report of the run, in any mode, to this file: the wall and CPU time of the '
+                         'field derivation, compilation, dynamics and output. A plain run without --engine advances '
+                         'one temperature at a time in chunks, with the result of the ensemble engine, and adds the '
+                         'equilibration and production times, the time and steps per second of each temperature and '
+                         'the counts of non-finite field evaluations and spins')
+
+parser.add_argument('--store',
+                    default=None,
+                    help='Also append the results, with the parameters of the run, to the binary columnar result '
+                         'store in this directory (see result_store.py), created if it does not exist')
+
+parser.add_argument('--resume',
+                    default=None,
+                    metavar='CHECKPOINT',
+                    help='Continue the run saved in this checkpoint file, with the options it was started with, '
+                         'giving exactly the result of an uninterrupted run (all other options are ignored)')
 
 parser.add_argument('--approximation',
                     choices=['classical-limit', 'quantum-approximation', 'quantum-exact'],
@@ -41,9 +155,52 @@ parser.add_argument('--anisotropy',
                     required=True,
                     help='Value of the anisotropy constant K')
 
-args = parser.parse_args()
+# --resume replaces the command line by the one saved in the checkpoint, so it is parsed on its own first
+resume_parser = argparse.ArgumentParser(add_help=False)
+resume_parser.add_argument('--resume', default=None)
+resume_file = resume_parser.parse_known_args()[0].resume
+
+if resume_file is not None:
+    with np.load(resume_file) as saved:
+        arguments = list(saved['arguments'])
+    args = parser.parse_args(arguments)
+    args.checkpoint = resume_file
+else:
+    arguments = sys.argv[1:]
+    args = parser.parse_args()
+
+# the mode options of the modes group, and --detect-equilibration, which --tolerance can also use
+MODE_OPTIONS = {'tolerance': '--tolerance', 'anneal': '--anneal', 'replica_exchange': '--replica-exchange',
+                'observables': '--observables', 'reweight': '--reweight', 'refine': '--refine',
+                'step_tolerance': '--step-tolerance', 'checkpoint': '--checkpoint', 'progress': '--progress',
+                'detect_equilibration': '--detect-equilibration'}
+mode = next((name for name in MODE_OPTIONS if getattr(args, name) not in (None, False)), None)
 
-integrator = args.integrator
+if args.detect_equilibration and mode not in ('tolerance', 'detect_equilibration'):
+    parser.error(f'--detect-equilibration is not supported with {MODE_OPTIONS[mode]}, only alone or with --tolerance')
+if args.engine is not None and mode not in (None, 'refine'):
+    parser.error(f'--engine is not used by {MODE_OPTIONS[mode]}, which runs the dynamics itself')
+if args.engine == 'quadrature' and mode == 'refine':
+    parser.error('--refine needs the dynamics of the scalar, ensemble or parallel engine')
+if args.threads is not None and args.engine != 'parallel':
+    parser.error('--threads is only used by the parallel engine')
+
+# the engine of a plain run or --refine, None for the modes which run the dynamics themselves
+engine = (args.engine or 'scalar') if mode in (None, 'refine') else None
+seed = args.seed
+threads = args.threads
+tolerance = args.tolerance
+detect_equilibration = args.detect_equilibration
+step_tolerance = args.step_tolerance
+reequilibration_time = args.anneal
+replica_exchange = args.replica_exchange
+observables = args.observables
+num_reweighted = args.reweight
+refine_tolerance = args.refine
+checkpoint_file = args.checkpoint
+report_file = args.report
+progress_file = args.progress
+store_path = args.store
 order = args.order
 qs = args.spin
 approximation = args.approximation
@@ -51,8 +208,23 @@ field = args.field
 stress = args.stress
 K = args.anisotropy
 
+# the run settings of the spin, see run_settings.py
+settings = run_settings.RUN_SETTINGS.get(int(2 * qs), run_settings.RUN_SETTINGS[None])
+integrator = args.integrator if args.integrator is not None else settings['integrator']
+
 
 def main():
+    # imported here rather than at the top so that --help does not wait for numba
+    import numba
+    import asd
+    import rng
+    import checkpoint
+    import reweighting
+    import refinement
+    import run_report
+    import progress
+    import result_store
+
     alpha = 0.5  # Gilbert Damping parameter.
 
     # applied_field = np.array((0, 0, field))  # Tesla, restricted to z-axis for this model
@@ -62,35 +234,198 @@ def main():
 
     # Temperature parameters
     temperatures = np.linspace(0.07, 5, 50)
-    num_realisation = 5
+    num_realisation = 5  # fewer than the figure scripts, which take settings['num_realisation']
 
     # Initial conditions
     s0 = np.array([1 / np.sqrt(3), 1.0 / np.sqrt(3), -1.0 / np.sqrt(3)])  # Initial spin
 
     # Equilibration time, final time and time step
-    equilibration_time = 5  # Equilibration time ns
-    production_time = 15  # Final time ns
-    time_step = 0.00005  # Time step ns, "linspace" so needs to turn num into int
+    equilibration_time = settings['equilibration_time']  # Equilibration time ns
+    production_time = settings['production_time']  # Final time ns
+    time_step = settings['time_step']  # Time step ns
+
+    run_seed = seed if seed is not None else np.random.randint(2**62)
 
-    solver = asd.solver_factory(integrator, approximation, order, qs, a_1, a_2, alpha, time_step)
-    sz = asd.compute_temperature_dependence(solver, temperatures, approximation, qs, time_step,
-                                            equilibration_time, production_time, num_realisation, s0)
+    # the columns written by each mode, known before the run so that the store is checked before it
+    columns = {'step_tolerance': ['temperature_kelvin', 'sz', 'steps'],
+               # equilibration_capped is 1 where the realisations ran out of equilibration time without being
+               # detected to have equilibrated
+               'tolerance': ['temperature_kelvin', 'sz', 'sz_error', 'production_steps', 'equilibration_steps']
+               + (['equilibration_capped'] if detect_equilibration else []),
+               'observables': ['temperature_kelvin', *asd.OBSERVABLES_DTYPE.names[1:], 'susceptibility',
+                               'heat_capacity'],
+               # acceptance of the swaps between each temperature and the next
+               'replica_exchange': ['temperature_kelvin', 'sz', 'acceptance'],
+               'anneal': ['temperature_kelvin', 'sz', 'equilibration_steps'],
+               'detect_equilibration': ['temperature_kelvin', 'sz', 'equilibration_steps', 'equilibration_capped'],
+               }.get(mode, ['temperature_kelvin', 'sz'])
+    if store_path is not None:
+        result_store.check_columns(store_path, columns)
+
+    # Compiled once per (approximation, spin, order) and cached on disk, the remaining parameters are
+    # passed at run time
+    report = None
+    if report_file is not None:
+        report = run_report.new_report(**{**vars(args), 'integrator': integrator, 'seed': run_seed,
+                                          'time_step': time_step, 'equilibration_time': equilibration_time,
+                                          'production_time': production_time, 'num_realisation': num_realisation,
+                                          'temperatures': temperatures.tolist()})
+    # a plain run without --engine is reported in detail, any other is timed as one dynamics phase
+    reported = report is not None and mode is None and args.engine is None
+    if report is not None:
+        solvers = run_report.load_solvers(report, approximation, order, qs, counted=reported)
+    else:
+        solvers = asd.solver_module(approximation, order, qs)
+    solver_args = asd.solver_arguments(integrator, qs, a_1, a_2, alpha, time_step)
+
+    # the reported run times its equilibration and production itself
+    with contextlib.nullcontext() if reported else run_report.phase(report, 'dynamics'):
+        if reported:
+            # the ensemble engine gives identical results, the reported run advances one temperature at a
+            # time in chunks
+            sz = run_report.compute_temperature_dependence_reported(
+                solvers, temperatures, approximation, qs, time_step, equilibration_time, production_time,
+                num_realisation, s0, run_seed, solver_args, report)
+            values = (temperatures, sz)
+        elif mode is None and engine == 'quadrature':
+            sz = solvers.compute_temperature_dependence_quadrature(temperatures, approximation, qs, a_1, a_2)
+            values = (temperatures, sz)
+        elif mode == 'step_tolerance':
+            if integrator not in ('heun', 'geometric-heun'):
+                raise RuntimeError(f'No error estimate for an adaptive time step with the integrator: {integrator}')
+            sz, steps = solvers.compute_temperature_dependence_adaptive_step(
+                temperatures, approximation, qs, equilibration_time, production_time, num_realisation, s0,
+                step_tolerance, run_seed, solver_args)
+            values = (temperatures, sz, steps)
+        elif mode == 'tolerance':
+            sz, sz_error, production_steps, equilibration_steps, capped = \
+                solvers.compute_temperature_dependence_adaptive(
+                    temperatures, approximation, qs, time_step, equilibration_time, production_time, num_realisation,
+                    s0, tolerance, detect_equilibration, run_seed, solver_args)
+            values = (temperatures, sz, sz_error, production_steps, equilibration_steps) \
+                + ((capped,) if detect_equilibration else ())
+        elif mode == 'reweight':
+            _, histograms = solvers.compute_temperature_dependence_histogram(
+                temperatures, approximation, qs, time_step, equilibration_time, production_time, num_realisation, s0,
+                run_seed, solver_args)
+            reweighted_temperatures = np.linspace(temperatures[0], temperatures[-1], num_reweighted)
+            sz = reweighting.reweight(solvers, temperatures, histograms, reweighted_temperatures, approximation, qs,
+                                      a_1, a_2)
+            values = (reweighted_temperatures, sz)
+        elif mode == 'refine':
+            if engine == 'parallel':
+                if threads is not None:
+                    numba.set_num_threads(threads)
+                compute = solvers.compute_temperature_dependence_parallel
+            elif engine == 'ensemble':
+                compute = solvers.compute_temperature_dependence_ensemble
+            else:
+                compute = solvers.compute_temperature_dependence
+
+            # each refinement draws from its own streams so that the new points are independent of the old
+            def compute_refinement(new_temperatures, refinement_index):
+                return compute(new_temperatures, approximation, qs, time_step, equilibration_time, production_time,
+                               num_realisation, s0, rng.substream_seed(run_seed, refinement_index), solver_args)
+
+            def reference(reference_temperatures):
+                return solvers.compute_temperature_dependence_quadrature(reference_temperatures, approximation, qs,
+                                                                         a_1, a_2)
+
+            refined_temperatures, sz = refinement.refine_temperature_grid(
+                compute_refinement, temperatures[0], temperatures[-1], refine_tolerance, reference=reference)
+            values = (refined_temperatures, sz)
+        elif mode == 'observables':
+            table = solvers.compute_temperature_dependence_observables(
+                temperatures, approximation, qs, time_step, equilibration_time, production_time, num_realisation, s0,
+                run_seed, solver_args)
+            susceptibility, heat_capacity = asd.fluctuation_response(table)
+            values = tuple(table[name] for name in table.dtype.names) + (susceptibility, heat_capacity)
+        elif mode == 'replica_exchange':
+            sz, acceptance = solvers.compute_temperature_dependence_exchange(
+                temperatures, approximation, qs, time_step, equilibration_time, production_time, num_realisation, s0,
+                asd.EXCHANGE_TIME, run_seed, solver_args)
+            values = (temperatures, sz, np.append(acceptance, np.nan))
+        elif mode == 'anneal':
+            # cooling, so that each temperature starts from a spin equilibrated where it is fastest
+            sz, equilibration_steps = solvers.compute_temperature_dependence_annealed(
+                temperatures[::-1], approximation, qs, time_step, equilibration_time, reequilibration_time,
+                production_time, num_realisation, s0, run_seed, solver_args)
+            values = (temperatures, sz[::-1], np.sum(equilibration_steps[::-1], axis=1))
+        elif mode == 'detect_equilibration':
+            sz, equilibration_steps, capped = solvers.compute_temperature_dependence_detected(
+                temperatures, approximation, qs, time_step, equilibration_time, production_time, num_realisation,
+                s0, run_seed, solver_args)
+            values = (temperatures, sz, np.sum(equilibration_steps, axis=1), capped)
+        elif mode == 'checkpoint':
+            # the ensemble engine gives identical results, the checkpointed run advances the whole ensemble at once
+            # the seed is saved with the command line so that the resumed run draws the same noise
+            run_arguments = arguments if seed is not None else arguments + ['--seed', str(run_seed)]
+            sz = checkpoint.compute_temperature_dependence_checkpointed(
+                solvers, temperatures, approximation, qs, time_step, equilibration_time, production_time,
+                num_realisation, s0, run_seed, solver_args, checkpoint_file, run_arguments)
+            values = (temperatures, sz)
+        elif mode == 'progress':
+            # the ensemble engine gives identical results, the chunked run advances one temperature at a time
+            sz, cancelled = progress.compute_temperature_dependence_chunked(
+                solvers, temperatures, approximation, qs, time_step, equilibration_time, production_time,
+                num_realisation, s0, run_seed, solver_args, progress.progress_file_writer(progress_file))
+            if cancelled:
+                print(f'cancelled with {np.count_nonzero(~np.isnan(sz))} of {len(temperatures)} temperatures done')
+            values = (temperatures, sz)
+        else:
+            if engine == 'parallel':
+                if threads is not None:
+                    numba.set_num_threads(threads)
+                compute = solvers.compute_temperature_dependence_parallel
+            elif engine == 'ensemble':
+                compute = solvers.compute_temperature_dependence_ensemble
+            else:
+                compute = solvers.compute_temperature_dependence
+
+            sz = compute(temperatures, approximation, qs, time_step, equilibration_time, production_time,
+                         num_realisation, s0, run_seed, solver_args)
+            values = (temperatures, sz)
 
     file_name = f'qsd_{integrator}_{approximation}_{qs:.1f}.txt'
 
-    header = f'spin: {qs}\n' \
-             f'alpha: {alpha}\n' \
-             f's0: {s0}\n' \
-             f'integrator: {integrator}\n' \
-             f'approximation: {approximation}\n' \
-             f'time_step: {time_step}\n' \
-             f'equilibration_time: {equilibration_time}\n' \
-             f'production_time: {production_time}\n' \
-             f'num_realisation: {num_realisation}\n' \
-             f'\n' \
-             'temperature_kelvin sz'
-
-    np.savetxt(file_name, np.column_stack((temperatures, sz)), fmt='%.8e', header=header)
+    parameters = {'spin': qs,
+                  'alpha': alpha,
+                  's0': s0,
+                  'integrator': integrator,
+                  'engine': None if reported else engine,
+                  'seed': run_seed,
+                  'approximation': approximation,
+                  'order': order,
+                  'field': field,
+                  'stress': stress,
+                  'anisotropy': K,
+                  'time_step': time_step,
+                  'equilibration_time': equilibration_time,
+                  'production_time': production_time,
+                  'num_realisation': num_realisation,
+                  'tolerance': tolerance,
+                  'detect_equilibration': detect_equilibration,
+                  'step_tolerance': step_tolerance,
+                  'reequilibration_time': reequilibration_time,
+                  'replica_exchange': replica_exchange,
+                  'observables': observables,
+                  'reweight': num_reweighted,
+                  'refine': refine_tolerance,
+                  'progress': progress_file}
+    header = ''.join(f'{name}: {value}\n' for name, value in parameters.items()) + '\n' + ' '.join(columns)
+    # stacked into floats for the text output only, the store keeps the type of each column
+    results = np.column_stack(values)
+
+    if report is not None:
+        with run_report.phase(report, 'output'):
+            np.savetxt(file_name, results, fmt='%.8e', header=header)
+        report['output'] = file_name
+        run_report.write_report(report, report_file)
+    else:
+        np.savetxt(file_name, results, fmt='%.8e', header=header)
+
+    if store_path is not None:
+        result_store.append_run(store_path, parameters, **dict(zip(columns, values)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import numpy as np
+import asd
+
+# Progress of long runs: the dynamics run one temperature at a time in chunks of compiled steps and
+# after each chunk the progress, the estimated time left and the running <Sz> are passed to a
+# callback, which can stop the run. The temperatures finished by then are kept.
+
+PROGRESS_CHUNK_STEPS = 20000  # steps between progress reports, 1 ns at the default time step
+
+
+def compute_temperature_dependence_chunked(solvers, temperatures, low_high_t, quantum_spin, time_step,
+                                           equilibration_time, production_time, num_realisation, spin_initial,
+                                           seed, solver_args, callback=None, chunk_steps=PROGRESS_CHUNK_STEPS):
+    """Returns the expectation values of compute_temperature_dependence_ensemble, for the solvers of
+    asd.solver_module, and whether the run was cancelled, NaN for the temperatures not finished.
+
+    The realisations of one temperature at a time are advanced by advance_ensemble in chunks of at
+    most chunk_steps, with the noise streams of the ensemble engine so the result is identical.
+    After each chunk callback(progress) is called with the dictionary of
+
+    temperatures_done, num_temperatures, temperature, step, num_steps: the temperatures finished,
+        the current one and the step reached in it out of num_steps
+    fraction, elapsed_seconds, eta_seconds: of the whole run
+    running_sz: the expectation value at the current temperature over the production steps so far
+        (None while equilibrating)
+    sz: the expectation values of the finished temperatures
+
+    and the run is cancelled if it returns a true value, or on a KeyboardInterrupt at any point of the
+    run, the callback included. Either way the temperatures finished are returned.
+    """
+    num_eq_steps = int(equilibration_time / time_step)
+    num_steps = num_eq_steps + int(production_time / time_step)
+    renormalisation = asd.renormalisation_factor(low_high_t, quantum_spin)
+
+    sz = np.full(temperatures.shape[0], np.nan)
+    start = time.perf_counter()
+    cancelled = False
+    try:
+        for i, temperature in enumerate(temperatures):
+            spins, ensemble_temperatures, temperature_indices, realisations = asd.initial_ensemble(
+                temperatures[i:i + 1], num_realisation, spin_initial)
+            temperature_indices[:] = i
+            spin_z = np.zeros(num_realisation)
+
+            step = 0
+            while step < num_steps and not cancelled:
+                last_step = min(step + chunk_steps, num_steps)
+                solvers.advance_ensemble(spins, ensemble_temperatures, step, last_step, num_eq_steps, seed,
+                                         temperature_indices, realisations, spin_z, solver_args)
+                step = last_step
+
+                if step == num_steps:
+                    sz[i] = asd.ensemble_average(spin_z / (num_steps - num_eq_steps), 1, num_realisation,
+                                                 renormalisation)[0]
+
+                if callback is not None:
+                    fraction = (i * num_steps + step) / (temperatures.shape[0] * num_steps)
+                    elapsed = time.perf_counter() - start
+                    running_sz = float(renormalisation * np.mean(spin_z) / (step - num_eq_steps)) \
+                        if step > num_eq_steps else None
+                    cancelled = bool(callback({'temperatures_done': i + int(step == num_steps),
+                                               'num_temperatures': temperatures.shape[0],
+                                               'temperature': float(temperature), 'step': step,
+                                               'num_steps': num_steps, 'fraction': fraction,
+                                               'elapsed_seconds': elapsed,
+                                               'eta_seconds': elapsed * (1 - fraction) / fraction,
+                                               'running_sz': running_sz,
+                                               'sz': sz[:i + int(step == num_steps)].tolist()}))
+            if cancelled:
+                break
+    except KeyboardInterrupt:
+        # wherever it lands, in the steps, the set up of a temperature or the callback, the temperatures
+        # finished are kept
+        cancelled = True
+
+    return sz, cancelled
+
+
+def progress_file_writer(file_name):
+    """Returns a callback for compute_temperature_dependence_chunked which writes each progress to
+    the JSON file_name, writing then renaming so that readers never see a partial file, and cancels
+    the run once a file named file_name with .cancel appended exists"""
+    def write_progress(progress):
+        temporary_file_name = f'{file_name}.{os.getpid()}.tmp'
+        with open(temporary_file_name, 'w') as progress_file:
+            json.dump(progress, progress_file)
+        os.replace(temporary_file_name, file_name)
+        return os.path.exists(f'{file_name}.cancel')
+
+    return write_progress
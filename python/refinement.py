@@ -0,0 +1,76 @@
+import numpy as np
+
+# Adaptive temperature grids: <Sz>(T) changes quickly at low temperature and slowly at high
+# temperature, so rather than simulating a fine uniform grid the grid is refined only where the
+# curve needs it.
+
+NUM_INITIAL_TEMPERATURES = 9
+MAX_TEMPERATURES = 200
+
+
+def interval_errors(temperatures, sz, reference=None):
+    """Returns, for each interval of the sorted temperatures, the estimated error of linearly
+    interpolating sz across it.
+
+    With a reference curve (a function of the temperatures, e.g. the quadrature engine or the
+    analytic solution scaled like sz) the error is the larger of its own interpolation error at
+    the midpoint, which is noise free, and the change across the interval of the disagreement of
+    sz with it, which is where sz has structure the reference lacks. Without one it is h²/4 times
+    the larger second divided difference of sz over the interval and a neighbour, the bound on the
+    interpolation error of a curve of that curvature. The noise of sz enters both estimates
+    from sz, so the tolerance should be above its statistical error.
+    """
+    widths = np.diff(temperatures)
+    if reference is not None:
+        midpoints = temperatures[:-1] + 0.5 * widths
+        reference_sz = reference(temperatures)
+        curvature = np.abs(reference(midpoints) - 0.5 * (reference_sz[:-1] + reference_sz[1:]))
+        disagreement = np.abs(np.diff(sz - reference_sz))
+        return np.maximum(curvature, disagreement)
+
+    slopes = np.diff(sz) / widths
+    second_differences = np.abs(np.diff(slopes) / (temperatures[2:] - temperatures[:-2]))
+    curvature = np.zeros(widths.shape[0])
+    curvature[:-1] = second_differences
+    curvature[1:] = np.maximum(curvature[1:], second_differences)
+    return 0.25 * widths**2 * curvature
+
+
+def refine_temperature_grid(compute, start, stop, tolerance, reference=None, min_spacing=None,
+                            num_initial=NUM_INITIAL_TEMPERATURES, max_temperatures=MAX_TEMPERATURES):
+    """Returns the irregular grid of temperatures from start to stop and sz at them, refined until
+    the interval_errors of every interval are at most tolerance, or it is no wider than
+    min_spacing (by default the spacing of a uniform grid of max_temperatures), or the grid has
+    max_temperatures.
+
+    compute(temperatures, refinement) returns sz at new temperatures, refinement counting the
+    calls from 0 so that each can draw its noise from its own streams (e.g. rng.substream_seed).
+    The grid starts as num_initial uniform temperatures and each refinement adds the midpoints of
+    the intervals whose error is too large, largest first.
+    """
+    if min_spacing is None:
+        min_spacing = (stop - start) / (max_temperatures - 1)
+
+    temperatures = np.linspace(start, stop, num_initial)
+    sz = np.asarray(compute(temperatures, 0), dtype=float)
+
+    refinement = 1
+    while temperatures.shape[0] < max_temperatures:
+        errors = interval_errors(temperatures, sz, reference)
+        widths = np.diff(temperatures)
+        candidates = np.flatnonzero((errors > tolerance) & (0.5 * widths >= min_spacing))
+        if candidates.shape[0] == 0:
+            break
+
+        candidates = candidates[np.argsort(errors[candidates])[::-1]]
+        candidates = candidates[:max_temperatures - temperatures.shape[0]]
+        new_temperatures = temperatures[candidates] + 0.5 * widths[candidates]
+        new_sz = np.asarray(compute(new_temperatures, refinement), dtype=float)
+
+        temperatures = np.concatenate((temperatures, new_temperatures))
+        sz = np.concatenate((sz, new_sz))
+        order = np.argsort(temperatures)
+        temperatures, sz = temperatures[order], sz[order]
+        refinement += 1
+
+    return temperatures, sz
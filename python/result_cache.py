@@ -0,0 +1,157 @@
+import os
+import json
+import hashlib
+import numpy as np
+import asd
+import rng
+import run_report
+
+# Points computed by the spin dynamics, one npz file of temperatures and values per parameter set
+RESULTS_DIR = os.path.join(asd.CACHE_DIR, 'results')
+
+
+# Line of the header of a figure table holding the parameter_key of the data in it
+PARAMETER_KEY_HEADER = 'parameter_key: '
+
+
+def parameter_hash(parameters):
+    """Returns a short hash of the dictionary of parameters, which are converted to lists"""
+    description = {name: np.asarray(value).tolist() for name, value in parameters.items()}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def result_key(kind, **parameters):
+    """Returns the hash naming the results of kind computed with the parameters by the current
+    version of the code (asd.code_version), so that a change of any of them gives a new key"""
+    return parameter_hash({**parameters, 'kind': kind, 'code_version': asd.code_version()})
+
+
+def parameter_key(approximation, order, quantum_spin, integrator, a_1, a_2, alpha, time_step, equilibration_time,
+                  production_time, num_realisation, spin_initial, seed=None, engine='scalar', report=None):
+    """Returns the hash of the arguments of compute_temperature_dependence which decide its result,
+    leaving out the temperatures, the engine, the report and the code version, so that the figure
+    tables stay valid across changes of the code"""
+    return parameter_hash({'approximation': approximation, 'order': order, 'quantum_spin': quantum_spin,
+                           'integrator': integrator, 'a_1': a_1, 'a_2': a_2, 'alpha': alpha, 'time_step': time_step,
+                           'equilibration_time': equilibration_time, 'production_time': production_time,
+                           'num_realisation': num_realisation, 'spin_initial': spin_initial, 'seed': seed})
+
+
+def stored_parameter_key(file_name):
+    """Returns the parameter_key in the header of the table file_name, None if it has none"""
+    with open(file_name) as table_file:
+        for line in table_file:
+            if not line.startswith('#'):
+                break
+            if line[1:].strip().startswith(PARAMETER_KEY_HEADER):
+                return line[1:].strip()[len(PARAMETER_KEY_HEADER):]
+    return None
+
+
+def load_points(key):
+    """Returns the dictionary from temperature to value of the points stored under key"""
+    file_name = os.path.join(RESULTS_DIR, f'{key}.npz')
+    if not os.path.exists(file_name):
+        return {}
+    with np.load(file_name) as stored:
+        return dict(zip(stored['temperatures'].tolist(), stored['values']))
+
+
+def store_points(key, points):
+    """Adds the dictionary from temperature to value to the points stored under key, merging with
+    any stored meanwhile by another process and writing then renaming so readers never see a partial
+    file"""
+    points = {**load_points(key), **points}
+    temperatures = np.array(sorted(points))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    file_name = os.path.join(RESULTS_DIR, f'{key}.npz')
+    temporary_file_name = f'{file_name}.{os.getpid()}.tmp.npz'
+    np.savez(temporary_file_name, temperatures=temperatures,
+             values=np.array([points[temperature] for temperature in temperatures]))
+    os.replace(temporary_file_name, file_name)
+
+
+def cached_points(key, temperatures, compute):
+    """Returns the values at the temperatures of the results stored under key, calling
+    compute(temperature) only for the temperatures not stored yet and storing its results"""
+    points = load_points(key)
+    missing = {}
+    for temperature in np.unique(temperatures).tolist():
+        if temperature not in points:
+            missing[temperature] = compute(temperature)
+
+    if missing:
+        store_points(key, missing)
+        points.update(missing)
+
+    return np.array([points[temperature] for temperature in np.asarray(temperatures).tolist()])
+
+
+def point_seed(seed, temperature):
+    """Returns the seed of the streams of the point at the temperature, derived from the bits of the
+    temperature so that its result does not depend on the other temperatures of the run"""
+    return rng.substream_seed(seed, np.float64(temperature).view(np.int64))
+
+
+def compute_temperature_dependence(temperatures, approximation, order, quantum_spin, integrator, a_1, a_2, alpha,
+                                   time_step, equilibration_time, production_time, num_realisation, spin_initial,
+                                   seed=None, engine='scalar', report=None):
+    """Returns the expectation value of the z-component of the spin at the temperatures, as the
+    compute_temperature_dependence of asd.solver_module, reusing every point computed before with the
+    same parameters and code and running the dynamics only for the missing ones.
+
+    Each point is run on its own with the streams of point_seed(seed, temperature), or a random seed
+    if seed is None, so a point is the same whichever grid it was first computed in. The engines
+    give the same results to rounding so the engine is not part of the key. If a run_report report
+    is given, the missing points are run by run_report.compute_temperature_dependence_reported, which
+    gives the results of the ensemble engine, and timed in it.
+    """
+    engines = {'scalar': 'compute_temperature_dependence',
+               'ensemble': 'compute_temperature_dependence_ensemble',
+               'parallel': 'compute_temperature_dependence_parallel'}
+    if engine not in engines:
+        raise RuntimeError(f'Unknown engine: {engine}')
+
+    if report is not None:
+        solvers = run_report.load_solvers(report, approximation, order, quantum_spin)
+    else:
+        solvers = asd.solver_module(approximation, order, quantum_spin)
+    solver_args = asd.solver_arguments(integrator, quantum_spin, a_1, a_2, alpha, time_step)
+    compute = getattr(solvers, engines[engine])
+
+    # the name of the solver module identifies the field: approximation, spin, order and code version
+    key = result_key('sz', solvers=solvers.__name__, solver_args=solver_args, equilibration_time=equilibration_time,
+                     production_time=production_time, num_realisation=num_realisation,
+                     spin_initial=spin_initial, seed=seed)
+
+    def compute_point(temperature):
+        point_stream_seed = point_seed(seed, temperature) if seed is not None else rng.random_seed()
+        if report is not None:
+            return run_report.compute_temperature_dependence_reported(
+                solvers, np.array([temperature]), approximation, quantum_spin, time_step, equilibration_time,
+                production_time, num_realisation, spin_initial, point_stream_seed, solver_args, report)[0]
+        return compute(np.array([temperature]), approximation, quantum_spin, time_step, equilibration_time,
+                       production_time, num_realisation, spin_initial, point_stream_seed, solver_args)[0]
+
+    return cached_points(key, temperatures, compute_point)
+
+
+def load_or_compute_temperature_dependence(file_name, force, temperatures, *args, **kwargs):
+    """Returns the expectation values at the temperatures read from the table file_name, the data
+    checked in with the figures, if it holds them for these temperatures and the parameter_key of the
+    other arguments. Otherwise they are computed by compute_temperature_dependence(temperatures,
+    *args, **kwargs), through the result cache, and saved to the table only if it does not exist or
+    force is true, so that the checked-in data is never overwritten by a run with other settings."""
+    key = parameter_key(*args, **kwargs)
+    if os.path.exists(file_name) and not force and stored_parameter_key(file_name) == key:
+        stored_temperatures, sz = np.loadtxt(file_name, unpack=True)
+        if stored_temperatures.shape == temperatures.shape and np.allclose(stored_temperatures, temperatures,
+                                                                            rtol=1e-7, atol=0.0):
+            return sz
+
+    sz = compute_temperature_dependence(temperatures, *args, **kwargs)
+    if force or not os.path.exists(file_name):
+        np.savetxt(file_name, np.column_stack((temperatures, sz)), fmt='%.8e',
+                   header=f'{PARAMETER_KEY_HEADER}{key}\ntemperature_kelvin sz-expectation_hbar')
+    return sz
@@ -0,0 +1,115 @@
+import os
+import json
+import fcntl
+import numpy as np
+
+# Binary columnar result store: a directory holding one raw little-endian file per column and
+# metadata.json with the columns, their types, the number of rows and the parameters of every run
+# appended. Columns are read back as memory maps, without parsing any text, and the store
+# describes itself. Appends hold an exclusive lock on the lock file of the store, so runs writing
+# to the same store at once are appended one after the other.
+
+STORE_FORMAT = 1
+METADATA_FILE = 'metadata.json'
+LOCK_FILE = 'lock'
+RUN_COLUMN = 'run'  # index of the run each row was appended by
+
+
+def column_file(path, name):
+    """Returns the file of the column name of the store at path"""
+    return os.path.join(path, f'{name}.bin')
+
+
+def load_metadata(path):
+    """Returns the metadata of the store at path"""
+    with open(os.path.join(path, METADATA_FILE)) as metadata_file:
+        return json.load(metadata_file)
+
+
+def save_metadata(path, metadata):
+    """Saves the metadata of the store at path, writing then renaming so readers never see a partial file"""
+    file_name = os.path.join(path, METADATA_FILE)
+    temporary_file_name = f'{file_name}.{os.getpid()}.tmp'
+    with open(temporary_file_name, 'w') as metadata_file:
+        json.dump(metadata, metadata_file, indent=2)
+    os.replace(temporary_file_name, file_name)
+
+
+def check_columns(path, names):
+    """Raises a RuntimeError unless runs with the columns names can be appended to the store at path,
+    which they can if it does not exist yet"""
+    if not os.path.exists(os.path.join(path, METADATA_FILE)):
+        return
+    metadata = load_metadata(path)
+    if metadata.get('format') != STORE_FORMAT:
+        raise RuntimeError(f'Store {path} has the format {metadata.get("format")}, not {STORE_FORMAT}')
+    store_names = [name for name in metadata['columns'] if name != RUN_COLUMN]
+    if sorted(store_names) != sorted(names):
+        raise RuntimeError(f'Store {path} has the columns {store_names}, not {list(names)}')
+
+
+def append_run(path, parameters, **columns):
+    """Appends the rows of the equally long columns to the store at path, with the parameters of the
+    run that computed them, and returns the index of the run. The store is created with these columns,
+    typed as given, if it does not exist, and must have the same columns otherwise.
+
+    The rows are written before the metadata counts them, so a store is never read with a partial
+    run and an append which is killed is overwritten by the next. The columns keep their types, so
+    pass them separately rather than stacked into one float array.
+    """
+    columns = {name: np.asarray(values) for name, values in columns.items()}
+    num_rows = {values.shape[0] for values in columns.values()}
+    if len(num_rows) != 1:
+        raise RuntimeError(f'Columns of different lengths: {sorted(num_rows)}')
+    num_rows = num_rows.pop()
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), 'a') as lock_file:
+        # held until the metadata is saved, so that another append reads the rows counted by this one
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        check_columns(path, columns)
+        if os.path.exists(os.path.join(path, METADATA_FILE)):
+            metadata = load_metadata(path)
+        else:
+            metadata = {'format': STORE_FORMAT, 'rows': 0, 'runs': [],
+                        'columns': {RUN_COLUMN: np.dtype('<i8').str,
+                                    **{name: values.dtype.newbyteorder('<').str for name, values in columns.items()}}}
+
+        run = len(metadata['runs'])
+        columns[RUN_COLUMN] = np.full(num_rows, run)
+        for name, dtype in metadata['columns'].items():
+            dtype = np.dtype(dtype)
+            file_name = column_file(path, name)
+            with open(file_name, 'r+b' if os.path.exists(file_name) else 'wb') as data_file:
+                data_file.seek(metadata['rows'] * dtype.itemsize)
+                data_file.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+                data_file.truncate()
+
+        metadata['runs'].append({'parameters': {name: np.asarray(value).tolist() for name, value in parameters.items()},
+                                 'first_row': metadata['rows'], 'rows': num_rows})
+        metadata['rows'] += num_rows
+        save_metadata(path, metadata)
+        return run
+
+
+def load_store(path, mmap=True):
+    """Returns (columns, runs) of the store at path: the dictionary from name to the array of the
+    column, read-only memory maps of the files unless mmap is False, and the list of the runs, each
+    a dictionary of its parameters, first_row and rows"""
+    metadata = load_metadata(path)
+    columns = {}
+    for name, dtype in metadata['columns'].items():
+        if metadata['rows'] == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        elif mmap:
+            columns[name] = np.memmap(column_file(path, name), dtype=dtype, mode='r', shape=(metadata['rows'],))
+        else:
+            columns[name] = np.fromfile(column_file(path, name), dtype=dtype, count=metadata['rows'])
+    return columns, metadata['runs']
+
+
+def load_run(path, run, mmap=True):
+    """Returns (columns, parameters) of the rows appended by the run-th run of the store at path"""
+    columns, runs = load_store(path, mmap)
+    rows = slice(runs[run]['first_row'], runs[run]['first_row'] + runs[run]['rows'])
+    return {name: values[rows] for name, values in columns.items() if name != RUN_COLUMN}, runs[run]['parameters']
@@ -0,0 +1,77 @@
+import numpy as np
+from scipy.special import logsumexp
+import asd
+
+# Multiple histogram reweighting (Ferrenberg and Swendsen, Phys. Rev. Lett. 63, 1195 (1989)) of the
+# n_z histograms of asd.compute_temperature_dependence_histogram. The dynamics sample
+# exp(-u_T(n_z)), u_T = β H_eff(n_z; β), where H_eff depends on the temperature through the field,
+# so each temperature uses its own reduced energy from the effective_energy_table of the solver
+# module. A curve is then reweighted to any temperature from a sparse set of simulated ones.
+
+WHAM_TOLERANCE = 1e-10  # change in the free energies at which the self-consistent iteration stops
+WHAM_MAX_ITERATIONS = 100000
+
+
+def bin_centres():
+    """Returns the n_z at the centres of the asd.HISTOGRAM_BINS bins"""
+    return -1.0 + (np.arange(asd.HISTOGRAM_BINS) + 0.5) * 2.0 / asd.HISTOGRAM_BINS
+
+
+def reduced_energies(solvers, temperatures, quantum_spin, a_1, a_2):
+    """Returns the (temperatures, bins) array of u_T = β H_eff at the bin centres, for the field of
+    the solver module solvers, the bins being the intervals of its effective_energy_table"""
+    energies = np.empty((len(temperatures), asd.HISTOGRAM_BINS))
+    for i, temperature in enumerate(temperatures):
+        beta = 1.0 / (asd.kB * temperature)
+        table = solvers.effective_energy_table(beta, float(quantum_spin), float(a_1), float(a_2))
+        energies[i] = beta * 0.5 * (table[:-1] + table[1:])
+    return energies
+
+
+def wham(histograms, energies):
+    """Returns the logarithm of the density of states of each bin (-inf where no histogram has
+    counts), normalised to a largest value of 0, from the histograms of the simulated temperatures
+    and their reduced energies, by iterating the weighted histogram equations
+
+    ln g_b = ln Sum_k H_kb - ln Sum_k N_k exp(f_k - u_kb),   f_k = -ln Sum_b g_b exp(-u_kb)
+
+    until the free energies f_k change by less than WHAM_TOLERANCE.
+    """
+    counts = np.sum(histograms, axis=0)
+    sampled = counts > 0
+    log_counts = np.log(counts[sampled])
+    log_samples = np.log(np.sum(histograms, axis=1))[:, np.newaxis]
+    energies = energies[:, sampled]
+
+    free_energies = np.zeros(histograms.shape[0])
+    for _ in range(WHAM_MAX_ITERATIONS):
+        log_density = log_counts - logsumexp(log_samples + free_energies[:, np.newaxis] - energies, axis=0)
+        updated_free_energies = -logsumexp(log_density - energies, axis=1)
+        updated_free_energies -= updated_free_energies[0]
+        converged = np.max(np.abs(updated_free_energies - free_energies)) < WHAM_TOLERANCE
+        free_energies = updated_free_energies
+        if converged:
+            break
+
+    log_density_of_states = np.full(histograms.shape[1], -np.inf)
+    log_density_of_states[sampled] = log_density - np.max(log_density)
+    return log_density_of_states
+
+
+def reweight(solvers, temperatures, histograms, target_temperatures, low_high_t, quantum_spin, a_1, a_2):
+    """Returns the expectation values of the z-component of the spin at the target_temperatures,
+    renormalised as by compute_temperature_dependence, reweighted from the histograms collected at
+    temperatures by compute_temperature_dependence_histogram with the solver module solvers.
+
+    The reweighted values are only as good as the histograms overlapping them, so the targets
+    should lie within the range of the simulated temperatures, and those close enough for
+    neighbouring histograms to overlap.
+    """
+    log_density_of_states = wham(histograms, reduced_energies(solvers, temperatures, quantum_spin, a_1, a_2))
+
+    log_weights = log_density_of_states - reduced_energies(solvers, target_temperatures, quantum_spin, a_1, a_2)
+    log_weights -= np.max(log_weights, axis=1, keepdims=True)
+    weights = np.exp(log_weights)
+    sz = np.sum(weights * bin_centres(), axis=1) / np.sum(weights, axis=1)
+
+    return asd.renormalisation_factor(low_high_t, quantum_spin) * sz
@@ -0,0 +1,115 @@
+import numpy as np
+from numba import njit
+
+# Philox4x32-10 constants from Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", SC11 (2011)
+PHILOX_M0 = np.uint64(0xD2511F53)
+PHILOX_M1 = np.uint64(0xCD9E8D57)
+PHILOX_W0 = np.uint64(0x9E3779B9)
+PHILOX_W1 = np.uint64(0xBB67AE85)
+MASK_32 = np.uint64(0xFFFFFFFF)
+SHIFT_32 = np.uint64(32)
+
+# Number of steps of noise generated at once by the drivers in asd.py
+NOISE_BLOCK = 1024
+
+
+@njit
+def philox4x32(c0, c1, c2, c3, k0, k1):
+    """Returns the four 32 bit words of the Philox4x32-10 bijection of the counter (c0, c1, c2, c3)
+    under the key (k0, k1). All words are held in uint64 but only the low 32 bits are used.
+    """
+    for _ in range(10):
+        p0 = PHILOX_M0 * c0
+        p1 = PHILOX_M1 * c2
+        c0, c1, c2, c3 = (((p1 >> SHIFT_32) ^ c1 ^ k0) & MASK_32, p1 & MASK_32,
+                          ((p0 >> SHIFT_32) ^ c3 ^ k1) & MASK_32, p0 & MASK_32)
+        k0 = (k0 + PHILOX_W0) & MASK_32
+        k1 = (k1 + PHILOX_W1) & MASK_32
+    return c0, c1, c2, c3
+
+
+@njit
+def random_seed():
+    """Returns a fresh 62 bit seed for when none is given. Numba seeds its own generator from the
+    operating system at startup so this differs between runs.
+    """
+    return np.random.randint(0, 2**62)
+
+
+@njit
+def substream_seed(seed, index):
+    """Returns the 62 bit seed of the index-th independent set of streams derived from seed, e.g.
+    for one point of a parameter sweep. It is the Philox bijection of the counter
+    (index, 2**32 - 1, 2**32 - 1) under the key seed, a realisation and temperature index that no
+    noise stream reaches.
+    """
+    key = np.uint64(seed)
+    counter = np.uint64(index)
+    w0, w1, _, _ = philox4x32(counter & MASK_32, counter >> SHIFT_32, MASK_32, MASK_32,
+                              key & MASK_32, (key >> SHIFT_32) & MASK_32)
+    return np.int64(((w0 << SHIFT_32) | w1) >> np.uint64(2))
+
+
+@njit
+def uniform_open(word):
+    """Returns the 32 bit word mapped to a double in the open interval (0, 1)"""
+    return (np.float64(word) + 0.5) * 2.0**-32
+
+
+@njit
+def standard_normals(seed, temperature_index, realisation, step):
+    """Returns four independent standard normal numbers which depend only on
+    (seed, temperature_index, realisation, step).
+
+    The seed is the Philox key and (step, realisation, temperature_index) the counter, so any
+    position of any stream can be generated directly, in any order and on any thread. The
+    uniforms are turned into normals with the Box-Muller transform.
+    """
+    key = np.uint64(seed)
+    counter = np.uint64(step)
+    w0, w1, w2, w3 = philox4x32(counter & MASK_32, counter >> SHIFT_32,
+                                np.uint64(realisation) & MASK_32, np.uint64(temperature_index) & MASK_32,
+                                key & MASK_32, (key >> SHIFT_32) & MASK_32)
+
+    radius_a = np.sqrt(-2.0 * np.log(uniform_open(w0)))
+    angle_a = 2.0 * np.pi * uniform_open(w1)
+    radius_b = np.sqrt(-2.0 * np.log(uniform_open(w2)))
+    angle_b = 2.0 * np.pi * uniform_open(w3)
+
+    return (radius_a * np.cos(angle_a), radius_a * np.sin(angle_a),
+            radius_b * np.cos(angle_b), radius_b * np.sin(angle_b))
+
+
+@njit
+def exchange_uniform(seed, realisation, exchange, pair):
+    """Returns the uniform number in (0, 1) deciding the exchange-th attempt to swap the pair of
+    neighbouring temperatures (pair, pair + 1) of realisation. It is drawn from the counter
+    (exchange, realisation, 2**31 + pair) under the key seed, a temperature index that no noise
+    stream reaches.
+    """
+    key = np.uint64(seed)
+    counter = np.uint64(exchange)
+    w0, _, _, _ = philox4x32(counter & MASK_32, counter >> SHIFT_32, np.uint64(realisation) & MASK_32,
+                             (np.uint64(2**31) + np.uint64(pair)) & MASK_32,
+                             key & MASK_32, (key >> SHIFT_32) & MASK_32)
+    return uniform_open(w0)
+
+
+@njit
+def normal_block(seed, temperature_index, realisation, first_step, out):
+    """Fills the (n, 3) array out with the standard normal noise of steps first_step to
+    first_step + n - 1 of the stream (seed, temperature_index, realisation)
+    """
+    for i in range(out.shape[0]):
+        out[i, 0], out[i, 1], out[i, 2], _ = standard_normals(seed, temperature_index, realisation,
+                                                              first_step + i)
+
+
+@njit
+def ensemble_normals(seed, temperature_indices, realisations, step, out):
+    """Fills the (N, 3) array out with the standard normal noise of one step for every row of an
+    ensemble, row i drawing from the stream (seed, temperature_indices[i], realisations[i])
+    """
+    for i in range(out.shape[0]):
+        out[i, 0], out[i, 1], out[i, 2], _ = standard_normals(seed, temperature_indices[i],
+                                                              realisations[i], step)
@@ -0,0 +1,121 @@
+import sys
+import json
+import time
+import platform
+import datetime
+import contextlib
+import numpy as np
+import asd
+
+# Run reports: the wall and CPU time of each phase of a run, the timing of each temperature and the
+# counts of non-finite field evaluations and spins, written as JSON. The dynamics run in chunks of
+# advance_ensemble_counted, which counts once per chunk so that its steps run at full speed, with
+# the same result as the ensemble engine.
+
+REPORT_CHUNK_STEPS = 20000  # steps between counts, 1 ns at the default time step
+
+# counters of advance_ensemble_counted, in the order of its counters array
+CHUNK_COUNTERS = ('field_evaluations', 'nonfinite_field_evaluations', 'nonfinite_realisations')
+
+
+def new_report(**parameters):
+    """Returns an empty report of a run with the parameters"""
+    return {'started': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'code_version': asd.code_version(), 'host': platform.node(), 'parameters': parameters,
+            'phases': {}, 'temperatures': [],
+            'counters': {'sympy_derivations': 0, 'steps': 0, **{name: 0 for name in CHUNK_COUNTERS}}}
+
+
+@contextlib.contextmanager
+def phase(report, name):
+    """Adds the wall and CPU time spent in the with block to the phase name of the report, if any"""
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        if report is not None:
+            timings = report['phases'].setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            timings['wall_seconds'] += time.perf_counter() - wall_start
+            timings['cpu_seconds'] += time.process_time() - cpu_start
+
+
+def load_solvers(report, approximation, order, quantum_spin, counted=True):
+    """Returns asd.solver_module(approximation, order, quantum_spin), timing it as the derivation
+    phase (the sympy derivation of the field, if it is in neither fields.py nor the cache, and the
+    writing and import of the module) and, if counted, the compilation of its
+    advance_ensemble_counted, or loading it from the numba cache, as the compile phase. Otherwise the
+    solvers are compiled on their first call, in the phase of the run."""
+    sympy_imported = 'sympy' in sys.modules
+    with phase(report, 'derivation'):
+        solvers = asd.solver_module(approximation, order, quantum_spin)
+    report['counters']['sympy_derivations'] += int(not sympy_imported and 'sympy' in sys.modules)
+
+    if not counted:
+        return solvers
+
+    with phase(report, 'compile'):
+        spins, temperatures, temperature_indices, realisations = asd.initial_ensemble(
+            np.ones(1), 1, np.array([0.0, 0.0, 1.0]))
+        solvers.advance_ensemble_counted(spins, temperatures, 0, 0, 0, 0, temperature_indices, realisations,
+                                         np.zeros(1), np.zeros(len(CHUNK_COUNTERS), dtype=np.int64),
+                                         asd.solver_arguments('symplectic', quantum_spin, 0.0, 0.0, 0.5, 1e-5))
+    return solvers
+
+
+def compute_temperature_dependence_reported(solvers, temperatures, low_high_t, quantum_spin, time_step,
+                                            equilibration_time, production_time, num_realisation, spin_initial,
+                                            seed, solver_args, report, chunk_steps=REPORT_CHUNK_STEPS):
+    """Returns the expectation values of compute_temperature_dependence_ensemble, for the solvers of
+    asd.solver_module, adding to the report the equilibration and production phases and, for each
+    temperature, its wall and CPU time, steps per second and the CHUNK_COUNTERS.
+
+    The realisations of one temperature at a time are advanced by advance_ensemble_counted in chunks
+    of at most chunk_steps, with the noise streams of the ensemble engine so the result is
+    identical. The field is evaluated at every finite spin after each chunk, and
+    nonfinite_realisations counts the spins which stopped being finite.
+    """
+    num_eq_steps = int(equilibration_time / time_step)
+    num_steps = num_eq_steps + int(production_time / time_step)
+
+    spin_z = np.zeros(temperatures.shape[0] * num_realisation)
+    for i, temperature in enumerate(temperatures):
+        spins, ensemble_temperatures, temperature_indices, realisations = asd.initial_ensemble(
+            temperatures[i:i + 1], num_realisation, spin_initial)
+        temperature_indices[:] = i
+        temperature_spin_z = spin_z[i * num_realisation:(i + 1) * num_realisation]
+        counters = np.zeros(len(CHUNK_COUNTERS), dtype=np.int64)
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        # equilibration and production are advanced apart so that the phases are timed apart
+        for name, first_step, last_step in (('equilibration', 0, num_eq_steps),
+                                            ('production', num_eq_steps, num_steps)):
+            with phase(report, name):
+                for chunk_start in range(first_step, last_step, chunk_steps):
+                    solvers.advance_ensemble_counted(spins, ensemble_temperatures, chunk_start,
+                                                     min(chunk_start + chunk_steps, last_step), num_eq_steps, seed,
+                                                     temperature_indices, realisations, temperature_spin_z, counters,
+                                                     solver_args)
+
+        wall_seconds, cpu_seconds = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        realisation_steps = num_steps * num_realisation
+        counts = dict(zip(CHUNK_COUNTERS, counters.tolist()))
+        report['temperatures'].append({'temperature': float(temperature), 'wall_seconds': wall_seconds,
+                                       'cpu_seconds': cpu_seconds, 'steps': realisation_steps,
+                                       'steps_per_second': realisation_steps / wall_seconds, **counts})
+        report['counters']['steps'] += realisation_steps
+        for name, count in counts.items():
+            report['counters'][name] += count
+
+    return asd.ensemble_average(spin_z / (num_steps - num_eq_steps), temperatures.shape[0], num_realisation,
+                                asd.renormalisation_factor(low_high_t, quantum_spin))
+
+
+def write_report(report, file_name):
+    """Writes the report as JSON, with the total times and the steps per second of the dynamics"""
+    dynamics_seconds = sum(report['phases'].get(name, {}).get('wall_seconds', 0.0)
+                           for name in ('equilibration', 'production'))
+    report['total'] = {name: sum(timings[name] for timings in report['phases'].values())
+                       for name in ('wall_seconds', 'cpu_seconds')}
+    report['steps_per_second'] = report['counters']['steps'] / dynamics_seconds if dynamics_seconds > 0 else None
+    with open(file_name, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
@@ -0,0 +1,14 @@
+"""Default run settings of the spin dynamics, the ones the figures were computed with.
+
+RUN_SETTINGS maps 2s to the integrator, time_step (ns), equilibration_time (ns), production_time (ns)
+and num_realisation used by the figure scripts, with 2s None for any other spin. pisd.py takes all
+but num_realisation. pareto.py --write-settings replaces this file with the settings it recommends.
+"""
+
+RUN_SETTINGS = {
+    1: {'integrator': 'symplectic', 'time_step': 5e-05, 'equilibration_time': 5, 'production_time': 15, 'num_realisation': 20},
+    2: {'integrator': 'symplectic', 'time_step': 5e-05, 'equilibration_time': 5, 'production_time': 15, 'num_realisation': 20},
+    3: {'integrator': 'symplectic', 'time_step': 5e-05, 'equilibration_time': 5, 'production_time': 15, 'num_realisation': 20},
+    4: {'integrator': 'symplectic', 'time_step': 5e-05, 'equilibration_time': 5, 'production_time': 15, 'num_realisation': 20},
+    None: {'integrator': 'symplectic', 'time_step': 5e-05, 'equilibration_time': 5, 'production_time': 15, 'num_realisation': 20},
+}
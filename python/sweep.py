@@ -0,0 +1,262 @@
+import os
+import time
+import argparse
+import itertools
+import concurrent.futures
+import numpy as np
+import asd
+import rng
+import analytic
+import result_store
+import run_settings
+
+# Functions of the modules of asd.solver_module which compute a temperature dependence
+ENGINES = {'scalar': 'compute_temperature_dependence',
+           'ensemble': 'compute_temperature_dependence_ensemble',
+           'parallel': 'compute_temperature_dependence_parallel',
+           'quadrature': 'compute_temperature_dependence_quadrature'}
+
+# sz_renormalised is sz times (s + 1)/s beyond order 2, as in the figures, to compare with sz_exact
+COLUMNS = ('spin', 'field', 'anisotropy', 'stress', 'temperature_kelvin', 'sz', 'sz_renormalised', 'sz_exact')
+
+# Units --anisotropy and --stress can be given in, in Joules
+ENERGY_UNITS = {'joule': 1.0, 'tesla': asd.g_factor * asd.muB}
+
+
+def parameter_grid(spins, fields, anisotropies, stresses):
+    """Returns the list of (spin, field, anisotropy, stress) points of the Cartesian product of the
+    values, ordered with the spin varying slowest so that points sharing a solver are adjacent
+    """
+    return list(itertools.product(spins, fields, anisotropies, stresses))
+
+
+def spin_settings(quantum_spin, integrator=None):
+    """Returns the run_settings of the spin, with the integrator replaced unless it is None"""
+    settings = dict(run_settings.RUN_SETTINGS.get(int(2 * quantum_spin), run_settings.RUN_SETTINGS[None]))
+    if integrator is not None:
+        settings['integrator'] = integrator
+    return settings
+
+
+def renormalisation(approximation, order, quantum_spin):
+    """Returns the factor by which the figures renormalise sz: 1 at order 2, i.e. the classical limit
+    or the quantum approximation of order 2, and (s + 1)/s otherwise, as for pareto.APPROXIMATIONS
+    where the exact field has no order"""
+    approximation_order = {'classical-limit': 2, 'quantum-exact': None}.get(approximation, order)
+    return 1.0 if approximation_order == 2 else (quantum_spin + 1) / quantum_spin
+
+
+def compute_point(engine, approximation, order, point, temperatures, alpha, settings, spin_initial, seed):
+    """Returns the expectation values of the z-component of the spin at the temperatures for one
+    (spin, field, anisotropy, stress) point, the field in Tesla and the energies in Joules, run with
+    the integrator, time_step, equilibration_time, production_time and num_realisation of settings.
+
+    Only the field expression depends on the spin, every other parameter is a run time argument of
+    the solver, so all points of a spin share one compiled solver, which numba loads from its disk
+    cache in each worker process.
+    """
+    quantum_spin, field, anisotropy, stress = point
+    a_1 = asd.g_factor * asd.muB * field
+    a_2 = anisotropy - stress
+
+    solvers = asd.solver_module(approximation, order, quantum_spin)
+    if engine == 'quadrature':
+        return solvers.compute_temperature_dependence_quadrature(temperatures, approximation, quantum_spin,
+                                                                 a_1, a_2)
+
+    time_step = settings['time_step']
+    solver_args = asd.solver_arguments(settings['integrator'], quantum_spin, a_1, a_2, alpha, time_step)
+    return getattr(solvers, ENGINES[engine])(temperatures, approximation, quantum_spin, time_step,
+                                             settings['equilibration_time'], settings['production_time'],
+                                             settings['num_realisation'], spin_initial, seed, solver_args)
+
+
+def compile_solvers(engine, integrator, approximation, order, spins, alpha, spin_initial):
+    """Compiles (or loads from the disk cache) the solvers for each spin once, before the workers start,
+    so that they do not all compile them at the same time"""
+    for quantum_spin in sorted(set(spins)):
+        settings = spin_settings(quantum_spin, integrator)
+        settings.update(equilibration_time=0.0, production_time=settings['time_step'], num_realisation=1)
+        compute_point(engine, approximation, order, (quantum_spin, 0.0, 0.0, 0.0), np.ones(1), alpha, settings,
+                      spin_initial, 0)
+
+
+def run_sweep(engine, integrator, approximation, order, spins, fields, anisotropies, stresses,
+              temperatures, alpha, spin_initial, seed, processes=None):
+    """Returns the (points, sz, sz_exact) of the sweep over every combination of spins, fields,
+    anisotropies and stresses at the temperatures, where points is the array of the
+    (spin, field, anisotropy, stress) of parameter_grid and sz and sz_exact are
+    (len(points), len(temperatures)) arrays from the spin dynamics and the exact quantum solution.
+
+    Each spin runs with its spin_settings, with the integrator given unless it is None.
+
+    The points are run by a pool of processes workers (all cores if None). Point p draws its
+    noise from the streams of rng.substream_seed(seed, p), so the results do not depend on the
+    number of workers or the order in which they finish.
+    """
+    points = parameter_grid(spins, fields, anisotropies, stresses)
+    compile_solvers(engine, integrator, approximation, order, spins, alpha, spin_initial)
+
+    sz = np.zeros((len(points), len(temperatures)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(compute_point, engine, approximation, order, point, temperatures, alpha,
+                                   spin_settings(point[0], integrator), spin_initial,
+                                   rng.substream_seed(seed, p)): p
+                   for p, point in enumerate(points)}
+        for future in concurrent.futures.as_completed(futures):
+            sz[futures[future]] = future.result()
+
+    sz_exact = np.zeros((len(points), len(temperatures)))
+    for p, (quantum_spin, field, anisotropy, stress) in enumerate(points):
+        sz_exact[p] = analytic.quantum_state_sz(quantum_spin, temperatures, stress,
+                                                asd.g_factor * asd.muB * field, anisotropy - stress)
+
+    return np.array(points, dtype=float), sz, sz_exact
+
+
+def sweep_table(approximation, order, points, temperatures, sz, sz_exact):
+    """Returns the sweep as one table with a row per (point, temperature) and the columns COLUMNS"""
+    num_temperatures = len(temperatures)
+    normalisation = np.array([renormalisation(approximation, order, quantum_spin) for quantum_spin in points[:, 0]])
+    return np.column_stack((np.repeat(points, num_temperatures, axis=0),
+                            np.tile(temperatures, len(points)), sz.ravel(),
+                            (normalisation[:, np.newaxis] * sz).ravel(), sz_exact.ravel()))
+
+
+def save_sweep(file_name, approximation, order, points, temperatures, sz, sz_exact, header):
+    """Saves the sweep_table as text"""
+    np.savetxt(file_name, sweep_table(approximation, order, points, temperatures, sz, sz_exact), fmt='%.8e',
+               header=f'{header}\n\n' + ' '.join(COLUMNS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep the spin dynamics over a grid of spins, fields, '
+                                                 'anisotropies and stresses.')
+
+    parser.add_argument('--integrator',
+                        choices=['runge-kutta-4', 'symplectic', 'heun', 'geometric-heun'],
+                        default=None,
+                        help='Numerical integration method for solving the spin dynamics (the one in run_settings.py '
+                             'for each spin if not given)')
+
+    parser.add_argument('--engine',
+                        choices=list(ENGINES),
+                        default='ensemble',
+                        help='Engine used by each worker for the temperatures and realisations of a point')
+
+    parser.add_argument('--approximation',
+                        choices=['classical-limit', 'quantum-approximation', 'quantum-exact'],
+                        required=True,
+                        help='Approximation scheme to use')
+
+    parser.add_argument('--order',
+                        type=int,
+                        default=2,
+                        help='order of the approximation-scheme, unused for classical-limit or quantum-exact')
+
+    parser.add_argument('--spin',
+                        type=float,
+                        nargs='+',
+                        required=True,
+                        help='Quantum spin values (should normally be integer multiples of 1/2)')
+
+    parser.add_argument('--field',
+                        type=float,
+                        nargs='+',
+                        required=True,
+                        help='Z-component of magnetic field values (in Tesla)')
+
+    parser.add_argument('--stress',
+                        type=float,
+                        nargs='+',
+                        required=True,
+                        help='Values of the product of lambda and sigma (in --energy-units)')
+
+    parser.add_argument('--anisotropy',
+                        type=float,
+                        nargs='+',
+                        required=True,
+                        help='Values of the anisotropy constant K (in --energy-units)')
+
+    parser.add_argument('--energy-units',
+                        choices=list(ENERGY_UNITS),
+                        default='joule',
+                        help='Units of --anisotropy and --stress: Joules, or g muB times 1 Tesla, in which negative '
+                             'values such as -2 can be passed as they are rather than as --anisotropy=-3.7e-23')
+
+    parser.add_argument('--temperatures',
+                        type=float,
+                        nargs=3,
+                        default=[0.07, 5, 50],
+                        metavar=('START', 'STOP', 'NUM'),
+                        help='Temperatures in Kelvin, as for numpy.linspace')
+
+    parser.add_argument('--seed',
+                        type=int,
+                        default=None,
+                        help='Seed of the random number streams (random if not given)')
+
+    parser.add_argument('--processes',
+                        type=int,
+                        default=None,
+                        help='Number of worker processes (all cores if not given)')
+
+    parser.add_argument('--output',
+                        default='sweep.tsv',
+                        help='File the consolidated results are written to')
+
+    parser.add_argument('--store',
+                        default=None,
+                        help='Also append the consolidated results, with the parameters of the sweep, to the binary '
+                             'columnar result store in this directory (see result_store.py)')
+
+    args = parser.parse_args()
+
+    alpha = 0.5  # Gilbert Damping parameter.
+
+    start, stop, num = args.temperatures
+    temperatures = np.linspace(start, stop, int(num))
+    anisotropies = [ENERGY_UNITS[args.energy_units] * anisotropy for anisotropy in args.anisotropy]
+    stresses = [ENERGY_UNITS[args.energy_units] * stress for stress in args.stress]
+
+    # Initial conditions
+    s0 = np.array([1 / np.sqrt(3), 1.0 / np.sqrt(3), -1.0 / np.sqrt(3)])  # Initial spin
+
+    # integrator, time step, equilibration and production time (ns) and number of realisations of each spin
+    settings = {quantum_spin: spin_settings(quantum_spin, args.integrator) for quantum_spin in args.spin}
+
+    seed = args.seed if args.seed is not None else np.random.randint(2**62)
+
+    if args.store is not None:
+        # before the sweep, rather than failing to store its results after it
+        result_store.check_columns(args.store, COLUMNS)
+
+    points, sz, sz_exact = run_sweep(args.engine, args.integrator, args.approximation, args.order,
+                                     args.spin, args.field, anisotropies, stresses, temperatures, alpha, s0,
+                                     seed, args.processes)
+
+    parameters = {'alpha': alpha,
+                  's0': s0,
+                  'engine': args.engine,
+                  'seed': seed,
+                  'approximation': args.approximation,
+                  'order': args.order,
+                  'energy_units': args.energy_units,
+                  'settings': settings,
+                  'points': len(points),
+                  'processes': args.processes or os.cpu_count()}
+    header = '\n'.join(f'{name}: {value}' for name, value in parameters.items())
+
+    # the anisotropies and stresses of the table are in Joules whatever the energy units
+    save_sweep(args.output, args.approximation, args.order, points, temperatures, sz, sz_exact, header)
+    if args.store is not None:
+        result_store.append_run(args.store, parameters,
+                                **dict(zip(COLUMNS, sweep_table(args.approximation, args.order, points, temperatures,
+                                                                sz, sz_exact).T)))
+
+
+if __name__ == "__main__":
+    start = time.process_time()
+    main()
+    end = time.process_time()
+    print(f'runtime: {end-start:.3f} (s)')